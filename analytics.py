@@ -0,0 +1,168 @@
+"""
+Incremental analytics over experiment_data_all.csv.
+
+Per (phase, professional_area) group: choice rates, the ambiguity-aversion index
+(share of the known box, in phases where only one box is known), mean reward by
+box, decision-time quantiles and the Rumsfeld gold/silver hit rates of Box B draws.
+
+The aggregate state is cached on disk together with the byte offset it covers, so
+a rerun after new sessions only parses the rows appended since. If the file was
+rewritten (it shrank or its header changed) the state is rebuilt from scratch.
+
+    python analytics.py [experiment_data_all.csv]
+"""
+import io
+import os
+import pickle
+import sys
+
+import numpy as np
+import pandas as pd
+
+from constants import BOX_CODES, RESULTS_FILE
+from phases import PHASE_SPECS, display_mode
+
+ANALYTICS_CACHE = 'experiment_analytics.pkl'
+GROUP_KEYS = ['phase', 'professional_area']
+DECISION_TIME_QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9]
+# Additive per-group statistics; every metric is derived from these
+SUM_COLUMNS = ['rounds', 'box_a', 'box_b', 'reward_a', 'reward_b', 'gold', 'silver']
+
+
+def _known_box(phase):
+    """The box shown with its probability when the other box is not, else None."""
+    if phase not in PHASE_SPECS:
+        return None
+    known = [box for box in BOX_CODES if display_mode(phase, box) == 'known']
+    return known[0] if len(known) == 1 else None
+
+
+class ResultsAnalytics:
+    """Aggregate state for one results CSV, advanced by update()."""
+
+    def __init__(self, path=RESULTS_FILE):
+        self.path = path
+        self.offset = 0
+        self.header = None
+        self.sums = pd.DataFrame(columns=GROUP_KEYS + SUM_COLUMNS).set_index(GROUP_KEYS)
+        self.decision_times = {}  # group -> float32 array of every decision time
+
+    # --- Persistence ---
+    @classmethod
+    def load(cls, path=RESULTS_FILE, cache_path=ANALYTICS_CACHE):
+        """Load the cached state for path, or start empty if there is none."""
+        if os.path.isfile(cache_path):
+            try:
+                with open(cache_path, 'rb') as f:
+                    state = pickle.load(f)
+                if isinstance(state, cls) and state.path == path:
+                    return state
+            except Exception as e:
+                print(f"Ignoring unreadable analytics cache {cache_path}: {e}")
+        return cls(path)
+
+    def save(self, cache_path=ANALYTICS_CACHE):
+        tmp = cache_path + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cache_path)
+
+    # --- Incremental update ---
+    def _reset(self):
+        fresh = ResultsAnalytics(self.path)
+        self.__dict__.update(fresh.__dict__)
+
+    def _read_header(self, f):
+        f.seek(0)
+        line = f.readline()
+        return line.decode('utf-8').strip().split(','), f.tell()
+
+    def update(self):
+        """Fold in the rows appended since the last call. Returns the number of new rows."""
+        if not os.path.isfile(self.path):
+            return 0
+        with open(self.path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return 0
+            header, body_start = self._read_header(f)
+            if size < self.offset or (self.header is not None and header != self.header):
+                self._reset()
+            if self.header is None:
+                self.header = header
+                self.offset = body_start
+            f.seek(self.offset)
+            chunk = f.read(size - self.offset)
+        # A writer may be mid-row; leave the partial last line for the next update
+        end = chunk.rfind(b'\n') + 1
+        if end == 0:
+            return 0
+        df = pd.read_csv(io.BytesIO(chunk[:end]), header=None, names=self.header)
+        self._add(df)
+        self.offset += end
+        return len(df)
+
+    def _add(self, df):
+        if df.empty:
+            return
+        box_a = (df['box_chosen'] == 'A').to_numpy()
+        reward = pd.to_numeric(df['reward'], errors='coerce').fillna(0).to_numpy()
+        frame = pd.DataFrame({
+            'phase': df['phase'].to_numpy(),
+            'professional_area': df['professional_area'].fillna('').astype(str).to_numpy(),
+            'rounds': 1,
+            'box_a': box_a.astype(np.int64),
+            'box_b': (~box_a).astype(np.int64),
+            'reward_a': np.where(box_a, reward, 0),
+            'reward_b': np.where(box_a, 0, reward),
+            'gold': (df['result'] == 'gold').to_numpy().astype(np.int64),
+            'silver': (df['result'] == 'silver').to_numpy().astype(np.int64),
+        })
+        grouped = frame.groupby(GROUP_KEYS, sort=True)
+        self.sums = grouped[SUM_COLUMNS].sum().add(self.sums, fill_value=0)
+
+        times = pd.to_numeric(df['decision_time'], errors='coerce').to_numpy(np.float32)
+        for group, index in grouped.indices.items():
+            new = times[index]
+            old = self.decision_times.get(group)
+            self.decision_times[group] = new if old is None else np.concatenate([old, new])
+
+    # --- Metrics ---
+    def metrics(self):
+        """One row per (phase, professional_area) with the derived metrics."""
+        s = self.sums.astype(float)
+        out = pd.DataFrame(index=s.index)
+        out['rounds'] = s['rounds'].astype(np.int64)
+        out['choice_rate_a'] = s['box_a'] / s['rounds']
+        out['choice_rate_b'] = s['box_b'] / s['rounds']
+        # Share of the known box; 1.0 means every choice avoided the ambiguous box.
+        # NaN where neither box is known (phase 3 pits ambiguity against Rumsfeld)
+        known = np.array([_known_box(int(phase)) or '' for phase in out.index.get_level_values('phase')])
+        out['ambiguity_aversion_index'] = np.select(
+            [known == 'A', known == 'B'], [out['choice_rate_a'], out['choice_rate_b']], np.nan
+        )
+        out['mean_reward_a'] = s['reward_a'] / s['box_a'].where(s['box_a'] > 0)
+        out['mean_reward_b'] = s['reward_b'] / s['box_b'].where(s['box_b'] > 0)
+        # Hit rates of the Rumsfeld specials among Box B draws
+        out['gold_hit_rate'] = s['gold'] / s['box_b'].where(s['box_b'] > 0)
+        out['silver_hit_rate'] = s['silver'] / s['box_b'].where(s['box_b'] > 0)
+        times = [self.decision_times.get(g, np.empty(0, np.float32)) for g in out.index]
+        times = [t[np.isfinite(t)] for t in times]
+        for q in DECISION_TIME_QUANTILES:
+            out[f'decision_time_p{int(q * 100)}'] = [np.quantile(t, q) if t.size else np.nan for t in times]
+        return out
+
+
+def compute_metrics(path=RESULTS_FILE, cache_path=ANALYTICS_CACHE):
+    """Bring the cached state up to date with path and return the metrics table."""
+    state = ResultsAnalytics.load(path, cache_path)
+    new_rows = state.update()
+    if new_rows:
+        state.save(cache_path)
+    return state.metrics()
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else RESULTS_FILE
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(compute_metrics(path).round(3))
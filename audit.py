@@ -0,0 +1,338 @@
+"""
+Replay every recorded session from its seeds and report rows whose draws do not
+follow.
+
+For each session the phase seeds give the initial probabilities, the chosen-box
+sequence walks p_safe/p_uncertain forward as adjust_probabilities does, and the
+per-round seeds give the uniforms each draw compared against. Only the seeding
+runs per round, with numpy's own generators; the probability walk, the draws,
+rewards, cumulative earnings and the comparison with the logged rows are array
+operations over a whole chunk of sessions, and chunks are spread across a
+process pool.
+
+The RNG mode and phase order come from experiment_seeds.csv. Sessions recorded
+before seeds were saved are replayed as 'generator' and, if that does not match,
+as 'legacy' (participant_id + phase * 1000 + round); the better fit is reported.
+
+    python audit.py [experiment_data_all.csv] [--output audit_mismatches.csv]
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from constants import *
+from parallel import run_chunked
+from phases import REWARDS, SPECIAL_PROB, initial_probs
+from streaming import iter_results
+
+AUDIT_COLUMNS = [
+    'session_id', 'participant_id', 'rng_mode', 'phase', 'round', 'box_chosen', 'reason',
+    'result', 'expected_result', 'reward', 'expected_reward',
+    'cumulative_earnings', 'expected_cumulative_earnings',
+    'p_safe', 'expected_p_safe', 'p_uncertain', 'expected_p_uncertain',
+]
+P_TOLERANCE = 5e-4 + 1e-9  # Probabilities are logged rounded to 3 decimals
+RED, BLACK, GOLD, SILVER = range(len(RESULT_CODES))
+
+
+def round_seed(rng_mode, participant_id, phase, rnd):
+    # Mirrors Experiment._round_seed
+    if rng_mode == 'legacy':
+        return participant_id + phase * 1000 + rnd
+    return [participant_id, phase, rnd]
+
+
+def phase_seed(rng_mode, participant_id, phase):
+    # Mirrors Experiment.reset_for_phase
+    if rng_mode == 'legacy':
+        return participant_id + phase
+    return [participant_id, phase]
+
+
+def _initial_probs(rng_modes, participant_ids, phases):
+    """Initial (p_safe, p_uncertain) per (session, phase) group, from the phase seeds."""
+    legacy_rng = np.random.RandomState()
+    init = np.empty((len(phases), 2))
+    for g, (rng_mode, participant_id, phase) in enumerate(zip(rng_modes, participant_ids, phases)):
+        seed = phase_seed(rng_mode, int(participant_id), int(phase))
+        if rng_mode == 'legacy':
+            # Reseeding one instance is much cheaper than a new RandomState per phase
+            legacy_rng.seed(seed)
+            rng = legacy_rng
+        else:
+            rng = np.random.default_rng(seed)
+        init[g] = [float(v) for v in initial_probs(phase, rng)]
+    return init
+
+
+def _round_uniforms(rng_modes, participant_ids, phases, rounds, special_probs):
+    """
+    Per row the special-ball, gold and red/black uniforms, drawn from numpy's own
+    generators seeded per round. 'legacy' rows reseed shared instances and draw only
+    what _LegacyDraw would, with gold recorded as a uniform of 0 and silver as 1.
+    """
+    n = len(phases)
+    u_special, u_gold, u_colour = np.ones(n), np.ones(n), np.ones(n)
+    np_rng, py_rng = np.random.RandomState(), random.Random()
+    for i in range(n):
+        rng_mode = rng_modes[i]
+        seed = round_seed(rng_mode, int(participant_ids[i]), int(phases[i]), int(rounds[i]))
+        if rng_mode != 'legacy':
+            u_special[i], u_gold[i], u_colour[i] = np.random.default_rng(seed).random(3)
+            continue
+        if special_probs[i]:
+            py_rng.seed(seed)
+            u_special[i] = py_rng.random()
+        np_rng.seed(seed)
+        if u_special[i] < special_probs[i]:
+            u_gold[i] = 0.0 if np_rng.choice(['gold', 'silver']) == 'gold' else 1.0
+        else:
+            u_colour[i] = np_rng.random_sample()
+    return u_special, u_gold, u_colour
+
+
+def replay(tasks, rng_modes):
+    """
+    Replay the rows of several sessions at once, each in its RNG mode. Returns the
+    concatenated logged arrays, the session index of every row and the expected
+    values; rows after a missing round of their phase are flagged in 'gap'.
+    """
+    arrays = {k: np.concatenate([task[2][k] for task in tasks]) for k in tasks[0][2]}
+    session = np.repeat(np.arange(len(tasks)), [len(task[2]['phase']) for task in tasks])
+    participant_ids = np.array([task[1] for task in tasks])
+    phase, rnd, box = arrays['phase'], arrays['round'], arrays['box']
+
+    # One row of the (group, round) grids per (session, phase)
+    group_keys, first, group = np.unique(session * (max(PHASES) + 1) + phase, return_index=True, return_inverse=True)
+    group_session, group_phase = session[first], phase[first]
+    cols = rnd - 1
+    width = max(ROUNDS_PER_PHASE, int(cols.max()) + 1)
+    present = np.zeros((len(group_keys), width), dtype=bool)
+    present[group, cols] = True
+    choose_a = np.zeros((len(group_keys), width), dtype=bool)
+    choose_a[group, cols] = box == 0
+
+    init = _initial_probs([rng_modes[s] for s in group_session], participant_ids[group_session], group_phase)
+    p_safe = np.empty((len(group_keys), width))
+    p_uncertain = np.empty((len(group_keys), width))
+    p_safe[:, 0], p_uncertain[:, 0] = init[:, 0], init[:, 1]
+    for r in range(1, width):
+        # Mirrors Experiment.adjust_probabilities
+        a = choose_a[:, r - 1]
+        p_safe[:, r] = np.where(a, np.maximum(PROB_LIMIT_MIN, p_safe[:, r - 1] - PROB_ADJUST),
+                                np.minimum(PROB_LIMIT_MAX, p_safe[:, r - 1] + PROB_ADJUST))
+        p_uncertain[:, r] = np.where(a, np.minimum(PROB_LIMIT_MAX, p_uncertain[:, r - 1] + PROB_ADJUST),
+                                     np.maximum(PROB_LIMIT_MIN, p_uncertain[:, r - 1] - PROB_ADJUST))
+    gap = ~np.cumprod(present, axis=1, dtype=bool)[group, cols]
+
+    ps, pu = p_safe[group, cols], p_uncertain[group, cols]
+    row_modes = [rng_modes[s] for s in session]
+    special_prob = SPECIAL_PROB[phase, box]
+    u_special, u_gold, u_colour = _round_uniforms(row_modes, participant_ids[session], phase, rnd, special_prob)
+    p = np.where(box == 0, ps, pu)
+    legacy = np.array([m == 'legacy' for m in row_modes], dtype=bool)
+    # RandomState.choice normalises [p, 1 - p] before comparing
+    threshold = np.where(legacy, p / (p + (1 - p)), p)
+    result = np.where(
+        u_special < special_prob,
+        np.where(u_gold < 0.5, GOLD, SILVER),
+        np.where(u_colour < threshold, RED, BLACK)
+    )
+    reward = REWARDS[phase, box, result].astype(np.int64)
+    per_round = np.zeros((len(group_keys), width), dtype=np.int64)
+    per_round[group, cols] = reward
+    expected = {
+        'init_p_safe': init[group, 0], 'init_p_uncertain': init[group, 1],
+        'p_safe': ps, 'p_uncertain': pu, 'result': result, 'reward': reward,
+        'cumulative_earnings': np.cumsum(per_round, axis=1)[group, cols], 'gap': gap,
+    }
+    return arrays, session, expected
+
+
+def _mismatches(arrays, expected):
+    """Per row the names of the checks it fails, joined by '+', or '' when it passes."""
+    failed = {
+        'result': arrays['result'] != expected['result'],
+        'reward': arrays['reward'] != expected['reward'],
+        'cumulative_earnings': arrays['cumulative_earnings'] != expected['cumulative_earnings'],
+        'p_safe': ~np.isclose(arrays['p_safe'], expected['p_safe'], rtol=0, atol=P_TOLERANCE),
+        'p_uncertain': ~np.isclose(arrays['p_uncertain'], expected['p_uncertain'], rtol=0, atol=P_TOLERANCE),
+    }
+    for col in ('init_p_safe', 'init_p_uncertain'):
+        # Blank in files written before the init probabilities were filled in
+        logged = arrays[col]
+        failed[col] = ~np.isnan(logged) & ~np.isclose(logged, expected[col], rtol=0, atol=1e-12)
+    reasons = np.full(len(arrays['phase']), '', dtype=object)
+    for name, mask in failed.items():
+        mask &= ~expected['gap']
+        reasons[mask] = reasons[mask] + '+' + name
+    reasons[expected['gap']] = '+missing_earlier_round'
+    return np.array([r[1:] for r in reasons], dtype=object)
+
+
+def _record_problems(rng_mode, participant_id, phases, rounds, record):
+    """Session-level checks of the saved seeds record against the seeding scheme."""
+    problems = []
+    seeds = record['seeds']
+    for phase in dict.fromkeys(phases.tolist()):
+        if f'phase_{phase}' in seeds and seeds[f'phase_{phase}'] != phase_seed(rng_mode, participant_id, phase):
+            problems.append(f'phase_{phase}_seed')
+    wrong = [
+        (p, r) for p, r in zip(phases.tolist(), rounds.tolist())
+        if f'phase_{p}_round_{r}' in seeds and seeds[f'phase_{p}_round_{r}'] != round_seed(rng_mode, participant_id, p, r)
+    ]
+    if wrong:
+        problems.append(f'round_seeds({len(wrong)})')
+    if seeds.get('phase_order') is not None:
+        expected = PHASES.copy()
+        # Mirrors Experiment.randomize_phases
+        random.Random(seeds['phase_order']).shuffle(expected)
+        played = list(dict.fromkeys(phases.tolist()))
+        if played != expected[:len(played)] or record['phase_order'][:len(played)] != played:
+            problems.append('phase_order')
+    return problems
+
+
+def _check(tasks, rng_modes):
+    arrays, session, expected = replay(tasks, rng_modes)
+    reasons = _mismatches(arrays, expected)
+    bad_per_session = np.bincount(session[reasons != ''], minlength=len(tasks))
+    return arrays, session, expected, reasons, bad_per_session
+
+
+def _mismatch_rows(task, label, arrays, expected, reasons, rows):
+    session_id, participant_id = task[0], task[1]
+    return [{
+        'session_id': session_id, 'participant_id': participant_id, 'rng_mode': label,
+        'phase': int(arrays['phase'][i]), 'round': int(arrays['round'][i]),
+        'box_chosen': BOX_CODES[arrays['box'][i]], 'reason': reasons[i],
+        'result': RESULT_CODES[arrays['result'][i]], 'expected_result': RESULT_CODES[expected['result'][i]],
+        'reward': int(arrays['reward'][i]), 'expected_reward': int(expected['reward'][i]),
+        'cumulative_earnings': int(arrays['cumulative_earnings'][i]),
+        'expected_cumulative_earnings': int(expected['cumulative_earnings'][i]),
+        'p_safe': float(arrays['p_safe'][i]), 'expected_p_safe': round(float(expected['p_safe'][i]), 3),
+        'p_uncertain': float(arrays['p_uncertain'][i]),
+        'expected_p_uncertain': round(float(expected['p_uncertain'][i]), 3),
+    } for i in rows]
+
+
+def _verify_chunk(tasks):
+    """
+    Replay a chunk of (session_id, participant_id, arrays, seeds record) tasks.
+    Sessions without a record are replayed as 'generator', and those that do not
+    match again as 'legacy'. Returns the AUDIT_COLUMNS rows and the rows checked.
+    """
+    rng_modes = [record['rng_mode'] if record else 'generator' for _, _, _, record in tasks]
+    checks = [_check(tasks, rng_modes)]
+    chosen = [(0, s) for s in range(len(tasks))]  # Which check, and the session's index in it
+    retry = [s for s, task in enumerate(tasks) if task[3] is None and checks[0][4][s]]
+    if retry:
+        checks.append(_check([tasks[s] for s in retry], ['legacy'] * len(retry)))
+        for j, s in enumerate(retry):
+            if checks[1][4][j] < checks[0][4][s]:
+                chosen[s] = (1, j)
+                rng_modes[s] = 'legacy'
+
+    out = []
+    for s, task in enumerate(tasks):
+        c, j = chosen[s]
+        arrays, session, expected, reasons, bad = checks[c]
+        label = rng_modes[s] if task[3] else f'{rng_modes[s]} (inferred)'
+        if bad[j]:
+            rows = np.flatnonzero((session == j) & (reasons != ''))
+            out.extend(_mismatch_rows(task, label, arrays, expected, reasons, rows))
+        if task[3]:
+            for problem in _record_problems(rng_modes[s], task[1], task[2]['phase'], task[2]['round'], task[3]):
+                out.append({'session_id': task[0], 'participant_id': task[1], 'rng_mode': label,
+                            'reason': f'seeds_record:{problem}'})
+    return out, sum(len(task[2]['phase']) for task in tasks)
+
+
+def load_seed_records(path=SEEDS_FILE):
+    """session_id -> {'rng_mode', 'phase_order', 'seeds'}; the last record of a session wins."""
+    if not os.path.isfile(path):
+        return {}
+    records = {}
+    df = pd.read_csv(path, dtype={'session_id': str}, keep_default_na=False)
+    for row in df.itertuples(index=False):
+        try:
+            records[row.session_id] = {
+                'rng_mode': row.rng_mode, 'phase_order': json.loads(row.phase_order), 'seeds': json.loads(row.seeds)
+            }
+        except ValueError as e:
+            print(f"Skipping unreadable seeds record of session {row.session_id}: {e}")
+    return records
+
+
+def _session_tasks(path, records):
+    columns = ['session_id', 'participant_id', 'phase', 'round', 'box_chosen', 'result', 'reward',
+               'cumulative_earnings', 'p_safe', 'p_uncertain', 'init_p_safe', 'init_p_uncertain']
+    frames = [batch[columns] for batch in iter_results(path)]
+    if not frames:
+        return []
+    df = pd.concat(frames, ignore_index=True)
+    # Rows logged before session ids existed are grouped by participant
+    key = df['session_id'].astype(object).where(
+        df['session_id'] != '', 'participant-' + df['participant_id'].astype(str)
+    )
+    # Columns are converted once and split by session, in order of first appearance
+    codes, session_ids = pd.factorize(key)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.cumsum(np.bincount(codes))[:-1]
+    columns = {
+        'phase': df['phase'].to_numpy(np.intp),
+        'round': df['round'].to_numpy(np.intp),
+        'box': df['box_chosen'].cat.codes.to_numpy(np.intp),
+        'result': df['result'].cat.codes.to_numpy(np.intp),
+    }
+    for col in ('reward', 'cumulative_earnings'):
+        columns[col] = df[col].to_numpy(np.int64)
+    for col in ('p_safe', 'p_uncertain', 'init_p_safe', 'init_p_uncertain'):
+        columns[col] = df[col].to_numpy(np.float64)
+    split = {col: np.split(values[order], bounds) for col, values in columns.items()}
+    participant_ids = df['participant_id'].to_numpy(np.int64)[order][np.r_[0, bounds]]
+    return [
+        (session_id, int(participant_ids[i]), {col: parts[i] for col, parts in split.items()},
+         records.get(session_id))
+        for i, session_id in enumerate(session_ids)
+    ]
+
+
+def audit(path=RESULTS_FILE, seeds_path=SEEDS_FILE, max_workers=None, chunk_size=None):
+    """
+    Replay every session in path across a process pool. Returns the mismatches as
+    an AUDIT_COLUMNS frame, the number of sessions and the number of rows checked.
+    """
+    tasks = _session_tasks(path, load_seed_records(seeds_path))
+    results = run_chunked(_verify_chunk, tasks, max_workers, chunk_size)
+    mismatches = [row for rows, _ in results for row in rows]
+    checked = sum(n for _, n in results)
+    return pd.DataFrame(mismatches, columns=AUDIT_COLUMNS), len(tasks), checked
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('path', nargs='?', default=RESULTS_FILE)
+    parser.add_argument('--seeds', default=SEEDS_FILE)
+    parser.add_argument('--output', help='CSV file for the mismatched rows')
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args()
+    started = time.perf_counter()
+    mismatches, sessions, checked = audit(args.path, args.seeds, args.workers)
+    elapsed = time.perf_counter() - started
+    print(f"Audited {checked} rows of {sessions} sessions in {elapsed:.2f}s: "
+          f"{len(mismatches)} mismatches in {mismatches['session_id'].nunique()} sessions")
+    if len(mismatches):
+        print(mismatches['reason'].value_counts().to_string())
+        if args.output:
+            mismatches.to_csv(args.output, index=False)
+            print(f"Mismatched rows written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+"""
+Micro-benchmarks for the experiment, rendering and persistence hot paths.
+
+Runs entirely locally: CSV files go to a temporary directory and Google Sheets is
+replaced by the SQLite stand-in from local_sheets.py, so no live sheet is needed. Results are
+written as JSON; --compare prints the ratio against an earlier run.
+
+    python benchmarks.py --output benchmarks/before.json
+    python benchmarks.py --compare benchmarks/before.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from constants import PHASES, ROUNDS_PER_PHASE
+from experiment import Experiment
+
+BENCH_DIR = 'benchmarks'
+CSV_SIZES = [0, 10_000, 100_000, 1_000_000]  # Existing rows in the CSV before appending
+SHEET_SIZES = [1_000, 10_000, 100_000]  # Existing rows in the local worksheet
+QUICK_CSV_SIZES = [0, 10_000]
+QUICK_SHEET_SIZES = [1_000, 10_000]
+
+
+def measure(func, repeat=7, number=1, setup=None):
+    """
+    Median, min and max seconds per call over repeat samples of number calls each.
+    setup() runs untimed before every sample.
+    """
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - started) / number)
+    return {
+        'median_s': float(np.median(samples)),
+        'min_s': float(min(samples)),
+        'max_s': float(max(samples)),
+        'repeat': repeat,
+        'number': number,
+    }
+
+
+def _play_phase(exp, phase, choices):
+    exp.reset_for_phase(phase)
+    for rnd, box in enumerate(choices, start=1):
+        exp.round = rnd
+        result, reward, _ = exp.draw_ball(box)
+        exp.cumulative_earnings += reward
+        exp.log_round(box, 1.0, result, reward)
+        exp.adjust_probabilities(box)
+
+
+def _choices(seed=0):
+    rng = np.random.default_rng(seed)
+    return [['A' if u < 0.5 else 'B' for u in rng.random(ROUNDS_PER_PHASE)] for _ in PHASES]
+
+
+def _played_experiment(participant_id, session_id):
+    exp = Experiment(participant_id, session_id=session_id, professional_area='Student')
+    for phase, choices in zip(exp.phase_order, _choices(participant_id)):
+        _play_phase(exp, phase, choices)
+    return exp
+
+
+# --- Experiment ---
+def bench_experiment(results):
+    for mode in ('schedule', 'generator', 'legacy'):
+        exp = Experiment(1, rng_mode=mode)
+        exp.reset_for_phase(3)
+
+        def one_round():
+            exp.round = 1
+            exp.draw_ball('B')
+            exp.adjust_probabilities('B')
+        results[f'round.draw_adjust.{mode}'] = measure(one_round, number=2000)
+
+        counter = iter(range(1, 10**9))
+        results[f'session.full.{mode}'] = measure(
+            lambda: _play_session(next(counter), mode), number=20
+        )
+
+
+def _play_session(participant_id, mode):
+    exp = Experiment(participant_id, rng_mode=mode)
+    for phase, choices in zip(exp.phase_order, _choices()):
+        _play_phase(exp, phase, choices)
+
+
+# --- Rendering ---
+def bench_rendering(results):
+    import ui
+    cases = [(phase, safe) for phase in PHASES for safe in range(30, 71, 2)]
+    results['display_boxes.html_uncached'] = measure(
+        lambda: [ui.box_html.__wrapped__(phase, safe) for phase, safe in cases], number=20
+    )
+    results['display_boxes.html_cached'] = measure(
+        lambda: [ui.box_html(phase, safe) for phase, safe in cases], number=200
+    )
+    # Outside a Streamlit run the element calls are no-ops, so this is the Python-side cost
+    results['display_boxes.call'] = measure(lambda: ui.display_boxes(3, 0.5, 0.5), number=200)
+
+
+# --- Persistence ---
+def _existing_results(n):
+    import simulation
+    from data import RESULTS_HEADER
+    sessions = max(1, -(-n // (len(PHASES) * ROUNDS_PER_PHASE)))
+    df = simulation.to_frame(simulation.simulate(sessions, seed=0))[RESULTS_HEADER]
+    return df.iloc[:n]
+
+
+def _questionnaire_entries(session_id, participant_id=1):
+    entries = [{
+        'session_id': session_id, 'participant_id': participant_id, 'professional_area': 'Student',
+        'phase': phase, 'reason': 'Looked safer', 'pattern': 'No', 'stress': 3, 'confidence': 4,
+        'perceived_control': 2, 'strategy': 'Mostly Box A',
+    } for phase in PHASES]
+    entries.append({
+        'session_id': session_id, 'participant_id': participant_id, 'professional_area': 'Student',
+        'phase': 'debrief', 'overall_stress': 3, 'overall_confidence': 4, 'phase_preference': 'Phase 1',
+        'final_strategy': 'Alternating', 'comments': '',
+    })
+    return entries
+
+
+def _existing_questionnaires(n):
+    import pandas as pd
+    from data import build_questionnaire_dataframe
+    one = build_questionnaire_dataframe(1, 'batch', _questionnaire_entries('seed'))
+    return pd.concat([one] * max(1, -(-n // len(one))), ignore_index=True).iloc[:n]
+
+
+def bench_csv(results, sizes):
+    """CSV appends and the full save path (WAL, CSV, Parquet, local Sheets) per existing file size."""
+    import data
+    ids = iter(range(1, 10**9))
+    exp = _played_experiment(1, 'bench')
+    frame = data.build_round_dataframe(exp.data, 1, exp.get_initial_probs())
+    for size in sizes:
+        _existing_results(size).to_csv(f'seed_results_{size}.csv', index=False)
+        _existing_questionnaires(size).to_csv(f'seed_questionnaires_{size}.csv', index=False)
+
+        def reset():
+            shutil.copyfile(f'seed_results_{size}.csv', data.RESULTS_FILE)
+            shutil.copyfile(f'seed_questionnaires_{size}.csv', data.QUESTIONNAIRES_FILE)
+
+        results[f'csv.append_session.rows_{size}'] = measure(
+            lambda: data.append_dataframe_to_csv(frame, data.RESULTS_FILE), repeat=5, number=5, setup=reset
+        )
+
+        def save_rounds():
+            # A fresh session id each time, or the duplicate check would drop the rows
+            exp.log.session_id = f'bench-{next(ids)}'
+            data.save_round_data(exp.data, 1, initial_probs=exp.get_initial_probs())
+        results[f'save_round_data.rows_{size}'] = measure(save_rounds, repeat=5, number=5, setup=reset)
+
+        def save_questionnaire():
+            data.save_questionnaire(1, 'batch', _questionnaire_entries(f'bench-{next(ids)}'))
+        results[f'save_questionnaire.rows_{size}'] = measure(save_questionnaire, repeat=5, number=5, setup=reset)
+
+
+class _NoAppendConnection:
+    """Connection without a worksheet client, forcing the read-concat-update fallback."""
+
+    def __init__(self, sheets):
+        self.sheets = sheets
+        self.client = None
+
+    def read(self, worksheet, ttl=None):
+        return self.sheets.read(worksheet, ttl)
+
+    def update(self, worksheet, data):
+        self.sheets.update(worksheet, data)
+
+
+def bench_sheets(results, sizes):
+    """append_dataframe_to_sheet of one session against worksheets of increasing size."""
+    import data
+    from local_sheets import LocalSheetsConnection
+    exp = _played_experiment(1, 'bench')
+    frame = data.build_round_dataframe(exp.data, 1, exp.get_initial_probs())
+    for size in sizes:
+        existing = _existing_results(size)
+        sheets = LocalSheetsConnection(path=f'sheets_{size}.sqlite3')
+        for path, conn in (('append', sheets), ('rewrite', _NoAppendConnection(sheets))):
+            def reset():
+                sheets.update('Results', existing)
+                data._sheet_headers.clear()
+            data.gsheets_conn = lambda conn=conn: conn
+            results[f'sheets.{path}.rows_{size}'] = measure(
+                lambda: data.append_dataframe_to_sheet(frame, 'Results'), repeat=5, setup=reset
+            )
+
+
+# --- Reporting ---
+def _environment():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'git_commit': commit,
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def compare(current, baseline):
+    """Print median time ratios against a previous run; above 1 means slower now."""
+    print(f"{'benchmark':<40} {'before':>12} {'now':>12} {'ratio':>7}")
+    for name, now in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        ratio = now['median_s'] / before['median_s'] if before['median_s'] else float('nan')
+        print(f"{name:<40} {before['median_s'] * 1e3:>10.3f}ms {now['median_s'] * 1e3:>10.3f}ms {ratio:>7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--output', help=f'JSON file to write (default {BENCH_DIR}/bench-<time>.json)')
+    parser.add_argument('--compare', help='earlier JSON results to compare against')
+    parser.add_argument('--quick', action='store_true', help='smaller file and sheet sizes')
+    parser.add_argument('--only', nargs='+', choices=['experiment', 'rendering', 'csv', 'sheets'])
+    args = parser.parse_args()
+
+    import data
+    from local_sheets import LocalSheetsConnection
+    output = os.path.abspath(args.output or os.path.join(BENCH_DIR, f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json"))
+    baseline = os.path.abspath(args.compare) if args.compare else None
+    suites = args.only or ['experiment', 'rendering', 'csv', 'sheets']
+
+    results = {}
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    sheets = LocalSheetsConnection()
+    data.gsheets_conn = lambda: sheets
+    try:
+        if 'experiment' in suites:
+            bench_experiment(results)
+        if 'rendering' in suites:
+            bench_rendering(results)
+        if 'csv' in suites:
+            bench_csv(results, QUICK_CSV_SIZES if args.quick else CSV_SIZES)
+        if 'sheets' in suites:
+            bench_sheets(results, QUICK_SHEET_SIZES if args.quick else SHEET_SIZES)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {'environment': _environment(), 'results': results}
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    for name, r in results.items():
+        print(f"{name:<40} median {r['median_s'] * 1e3:10.3f} ms  min {r['min_s'] * 1e3:10.3f} ms")
+    print(f"Results written to {output}")
+    if baseline:
+        with open(baseline) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""
+Columnar Parquet store kept alongside the CSV files.
+
+Each write lands as a small file under <root>/<kind>/date=YYYY-MM-DD/. compact()
+merges the small files of a day into one file sorted by participant (then phase and
+round for results), so the row-group statistics let read() skip data by phase or
+participant. Run `python columnar.py` to compact.
+read() also skips whole days outside the requested date range.
+"""
+import os
+import time
+import uuid
+from datetime import date
+
+COLUMNAR_ROOT = 'experiment_data_parquet'
+RESULTS = 'results'
+QUESTIONNAIRES = 'questionnaires'
+SMALL_FILE_BYTES = 4 * 1024 * 1024  # Files below this size are merged by compact()
+ROW_GROUP_SIZE = 64 * 1024
+SORT_KEYS = {
+    RESULTS: [('participant_id', 'ascending'), ('phase', 'ascending'), ('round', 'ascending')],
+    # Questionnaire phase is dictionary-encoded, which Arrow cannot sort on
+    QUESTIONNAIRES: [('participant_id', 'ascending')],
+}
+QUESTIONNAIRE_RATINGS = ['stress', 'confidence', 'perceived_control', 'overall_stress', 'overall_confidence']
+
+
+def _schemas():
+    import pyarrow as pa
+    category = pa.dictionary(pa.int16(), pa.string())
+    results = pa.schema([
+        ('session_id', pa.string()),
+        ('participant_id', pa.int64()),
+        ('professional_area', category),
+        ('phase', pa.int8()),
+        ('round', pa.int8()),
+        ('box_chosen', category),
+        ('decision_time', pa.float64()),
+        ('result', category),
+        ('reward', pa.int16()),
+        ('cumulative_earnings', pa.int32()),
+        ('p_safe', pa.float64()),
+        ('p_uncertain', pa.float64()),
+        ('init_p_safe', pa.float64()),
+        ('init_p_uncertain', pa.float64()),
+    ])
+    # phase is a string here because the debrief row uses phase='debrief'
+    questionnaires = pa.schema([
+        ('session_id', pa.string()),
+        ('participant_id', pa.int64()),
+        ('professional_area', category),
+        ('phase', category),
+        ('reason', pa.string()),
+        ('pattern', pa.string()),
+        ('stress', pa.int8()),
+        ('confidence', pa.int8()),
+        ('perceived_control', pa.int8()),
+        ('strategy', pa.string()),
+        ('overall_stress', pa.int8()),
+        ('overall_confidence', pa.int8()),
+        ('phase_preference', pa.string()),
+        ('final_strategy', pa.string()),
+        ('comments', pa.string()),
+    ])
+    return {RESULTS: results, QUESTIONNAIRES: questionnaires}
+
+
+def _to_table(df, kind):
+    import pandas as pd
+    import pyarrow as pa
+    df = df.copy()
+    df['session_id'] = df['session_id'].astype(str)
+    if kind == QUESTIONNAIRES:
+        df['phase'] = df['phase'].astype(str)
+        # Blank ratings (e.g. on the debrief row) become nulls
+        for col in QUESTIONNAIRE_RATINGS:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int8')
+        for col in ['reason', 'pattern', 'strategy', 'phase_preference', 'final_strategy', 'comments']:
+            df[col] = df[col].fillna('').astype(str)
+    return pa.Table.from_pandas(df, schema=_schemas()[kind], preserve_index=False)
+
+
+def _day_dir(root, kind, day):
+    return os.path.join(root, kind, f"date={day.isoformat()}")
+
+
+def _write_table(table, directory, prefix):
+    import pyarrow.parquet as pq
+    os.makedirs(directory, exist_ok=True)
+    name = f"{prefix}-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.parquet"
+    path = os.path.join(directory, name)
+    # Readers only pick up *.parquet, so a half-written file is never visible
+    pq.write_table(table, path + '.tmp', row_group_size=ROW_GROUP_SIZE)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def append_partition(df, kind, root=COLUMNAR_ROOT, day=None):
+    """Write one batch of rows as a new Parquet file in today's partition."""
+    table = _to_table(df, kind).sort_by(SORT_KEYS[kind])
+    return _write_table(table, _day_dir(root, kind, day or date.today()), 'part')
+
+
+def _day_dirs(root, kind, start_date=None, end_date=None):
+    base = os.path.join(root, kind)
+    if not os.path.isdir(base):
+        return []
+    days = []
+    for name in sorted(os.listdir(base)):
+        if not name.startswith('date='):
+            continue
+        day = date.fromisoformat(name[len('date='):])
+        if (start_date and day < start_date) or (end_date and day > end_date):
+            continue
+        days.append(os.path.join(base, name))
+    return days
+
+
+def _parquet_files(directory):
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.parquet')
+    )
+
+
+def compact(kind=RESULTS, root=COLUMNAR_ROOT, small_file_bytes=SMALL_FILE_BYTES):
+    """
+    Merge the small files of each day into one sorted file. Meant to run from a
+    single scheduled job; returns the number of files merged away.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    merged = 0
+    for directory in _day_dirs(root, kind):
+        small = [f for f in _parquet_files(directory) if os.path.getsize(f) < small_file_bytes]
+        if len(small) < 2:
+            continue
+        table = pa.concat_tables([pq.read_table(f, schema=_schemas()[kind]) for f in small])
+        table = table.unify_dictionaries().combine_chunks().sort_by(SORT_KEYS[kind])
+        _write_table(table, directory, 'compacted')
+        for f in small:
+            os.remove(f)
+        merged += len(small)
+    return merged
+
+
+def read(kind=RESULTS, phases=None, participant_ids=None, start_date=None, end_date=None,
+         columns=None, root=COLUMNAR_ROOT):
+    """
+    Read rows as a DataFrame. Days outside [start_date, end_date] are never opened;
+    phase and participant filters skip row groups using the Parquet statistics.
+    """
+    import pyarrow.dataset as ds
+    schema = _schemas()[kind]
+    files = [f for directory in _day_dirs(root, kind, start_date, end_date) for f in _parquet_files(directory)]
+    if not files:
+        return schema.empty_table().to_pandas()
+    dataset = ds.dataset(files, schema=schema, format='parquet')
+    expr = None
+    if phases is not None:
+        values = [str(p) for p in phases] if kind == QUESTIONNAIRES else list(phases)
+        expr = ds.field('phase').isin(values)
+    if participant_ids is not None:
+        clause = ds.field('participant_id').isin(list(participant_ids))
+        expr = clause if expr is None else expr & clause
+    return dataset.to_table(columns=columns, filter=expr).to_pandas()
+
+
+if __name__ == '__main__':
+    # Compaction job, e.g. run nightly from cron in the app's working directory
+    for kind in (RESULTS, QUESTIONNAIRES):
+        print(f"{kind}: merged {compact(kind)} small files")
@@ -16,3 +16,18 @@ RUMSFELD_SPECIAL_PROB_PHASE2 = 0.50
 RUMSFELD_SPECIAL_PROB_PHASE3 = 0.50
 DATA_FILE = 'experiment_data.csv'
 PHASES = [1, 2, 3]
+# 'generator': per-session numpy Generators keyed on (participant, phase, round)
+# 'schedule': same draws as 'generator', pre-generated for the whole phase in reset_for_phase
+# 'legacy': reproduces the draws recorded before per-session generators were introduced
+RNG_MODE = 'schedule'
+# Categorical codes used by the compact round log
+BOX_CODES = ['A', 'B']
+RESULT_CODES = ['red', 'black', 'gold', 'silver']
+# Output files and the results columns, shared by data.py and the offline tools
+RESULTS_FILE = 'experiment_data_all.csv'
+SEEDS_FILE = 'experiment_seeds.csv'  # One row per session with its seeds, for audit.py
+RESULTS_HEADER = [
+    'session_id', 'participant_id', 'professional_area', 'phase', 'round', 'box_chosen', 'decision_time',
+    'result', 'reward', 'cumulative_earnings', 'p_safe', 'p_uncertain',
+    'init_p_safe', 'init_p_uncertain'
+]
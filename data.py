@@ -1,15 +1,22 @@
-import pandas as pd
 import os
 import time
-from constants import DATA_FILE
+from constants import DATA_FILE, PHASES, BOX_CODES, RESULT_CODES, RESULTS_HEADER, RESULTS_FILE, SEEDS_FILE
+from wal import WriteAheadLog
+from sessions import SessionStore
+import columnar
+import metrics
+from metrics import timer, timed
+from warmup import wait_for_warmup
 
 # Google Sheets integration
 import streamlit as st
-from streamlit_gsheets import GSheetsConnection
 
 GOOGLE_SHEET_FILE = 'my_experiment_data'  # Name of the Google Sheets file
+# 'gsheets' for the real spreadsheet, 'local' for the SQLite stand-in in local_sheets.py
+SHEETS_BACKEND = os.environ.get('SHEETS_BACKEND', 'gsheets')
 RESULTS_SHEET = 'Results'
 QUESTIONNAIRES_SHEET = 'Questionnaires'
+SEEDS_SHEET = 'Seeds'  # Logged like a worksheet, but only ever written to SEEDS_FILE
 
 QUESTIONNAIRE_HEADER = [
     'session_id', 'participant_id', 'professional_area', 'phase',
@@ -24,32 +31,124 @@ def get_gsheet_worksheet(sheet_name):
 # Create and cache a GSheets connection resource
 @st.cache_resource
 def gsheets_conn():
+    if SHEETS_BACKEND == 'local':
+        from local_sheets import LocalSheetsConnection
+        return LocalSheetsConnection()
+    # Imported here: the connector pulls in gspread and pandas, which the first screens never need
+    wait_for_warmup()
+    from streamlit_gsheets import GSheetsConnection
     return st.connection("gsheets", type=GSheetsConnection)
 
-def append_dataframe_to_sheet(df, worksheet):
+# Header row of each worksheet, cached so appends never have to read the sheet body
+_sheet_headers = {}
+
+def _select_worksheet(conn, worksheet):
+    """
+    Return the underlying gspread worksheet, or None when the connection cannot
+    write rows directly (e.g. public spreadsheet access).
+    """
+    select = getattr(getattr(conn, 'client', None), '_select_worksheet', None)
+    if select is None:
+        return None
+    return select(worksheet=worksheet)
+
+def _cell_value(value):
+    # gspread serializes to JSON, so unwrap numpy scalars and blank out NaN
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+def append_rows_to_sheet(df, worksheet):
+    """
+    Append only the new rows using the Sheets append API. Columns are aligned to the
+    cached header; unseen columns are added to the header row first.
+    Returns False when the connection does not support direct appends.
+    """
+    conn = gsheets_conn()
+    ws = _select_worksheet(conn, worksheet)
+    if ws is None:
+        return False
+    try:
+        header = _sheet_headers.get(worksheet)
+        if header is None:
+            with timer('experiment_sheet_read_seconds', worksheet=worksheet):
+                header = [h for h in ws.row_values(1) if h != ""]
+        new_cols = [c for c in df.columns if c not in header]
+        if new_cols:
+            header = header + new_cols
+            with timer('experiment_sheet_update_seconds', worksheet=worksheet):
+                ws.update(range_name='A1', values=[header])
+        _sheet_headers[worksheet] = header
+
+        aligned = df.reindex(columns=header, fill_value="")
+        values = [[_cell_value(v) for v in row] for row in aligned.itertuples(index=False, name=None)]
+        with timer('experiment_sheet_update_seconds', worksheet=worksheet):
+            ws.append_rows(values, value_input_option='USER_ENTERED', table_range='A1')
+    except Exception:
+        # Header may have changed remotely; re-read it on the next append
+        _sheet_headers.pop(worksheet, None)
+        raise
+    return True
+
+def rewrite_dataframe_to_sheet(df, worksheet):
     """
     Append rows by reading existing data, concatenating, and updating the worksheet.
     Uses ttl="0" to avoid cache. Aligns columns to the union of existing and new.
+    Only used when the connection cannot append rows directly.
     """
-    try:
-        conn = gsheets_conn()
+    wait_for_warmup()
+    import pandas as pd
+    conn = gsheets_conn()
+    with timer('experiment_sheet_read_seconds', worksheet=worksheet):
         existing_df = conn.read(worksheet=worksheet, ttl="0")
-        if not isinstance(existing_df, pd.DataFrame) or existing_df is None:
-            existing_df = pd.DataFrame()
+    if not isinstance(existing_df, pd.DataFrame) or existing_df is None:
+        existing_df = pd.DataFrame()
 
-        # Determine unified columns (preserve existing order, then add any new columns)
-        existing_cols = list(existing_df.columns) if not existing_df.empty else []
-        new_cols = [c for c in df.columns if c not in existing_cols]
-        unified_cols = existing_cols + new_cols if existing_cols else list(df.columns)
+    # Determine unified columns (preserve existing order, then add any new columns)
+    existing_cols = list(existing_df.columns) if not existing_df.empty else []
+    new_cols = [c for c in df.columns if c not in existing_cols]
+    unified_cols = existing_cols + new_cols if existing_cols else list(df.columns)
 
-        # Reindex both frames to unified columns
-        existing_aligned = existing_df.reindex(columns=unified_cols, fill_value="") if not existing_df.empty else pd.DataFrame(columns=unified_cols)
-        new_aligned = df.reindex(columns=unified_cols, fill_value="")
+    # Reindex both frames to unified columns
+    existing_aligned = existing_df.reindex(columns=unified_cols, fill_value="") if not existing_df.empty else pd.DataFrame(columns=unified_cols)
+    new_aligned = df.reindex(columns=unified_cols, fill_value="")
 
-        combined = pd.concat([existing_aligned, new_aligned], ignore_index=True)
+    combined = pd.concat([existing_aligned, new_aligned], ignore_index=True)
+    with timer('experiment_sheet_update_seconds', worksheet=worksheet):
         conn.update(worksheet=worksheet, data=combined)
+
+def append_dataframe_to_sheet(df, worksheet):
+    """
+    Append rows to the worksheet, sending only the new rows when possible.
+    Returns True on success, False if the write failed.
+    """
+    try:
+        with timer('experiment_sheet_append_seconds', worksheet=worksheet):
+            if not append_rows_to_sheet(df, worksheet):
+                rewrite_dataframe_to_sheet(df, worksheet)
+        return True
     except Exception as e:
         print(f"GSheetsConnection error appending to {worksheet}: {e}")
+        metrics.inc('experiment_sheet_errors_total', worksheet=worksheet)
+        return False
+
+# Process-wide write-ahead log; every batch is logged before it goes to Sheets
+@st.cache_resource
+def write_ahead_log():
+    wal = WriteAheadLog(
+        push=lambda df, worksheet: append_dataframe_to_sheet(df, worksheet),
+        write_local=write_local_copy,
+        local_only=[SEEDS_SHEET]
+    )
+    wal.start_replayer()
+    return wal
+
+# Process-wide store of sessions in progress, written round by round
+@st.cache_resource
+def session_store():
+    return SessionStore()
 
 def save_rows_to_gsheet_worksheet(sheet_name, rows, header=None):
     # No longer needed when using GSheetsConnection directly
@@ -72,45 +171,134 @@ def test_gsheet():
     except Exception as e:
         print(f'Google Sheets integration failed: {e}')
 
-# Save all phase results to a single CSV file for all participants
-def save_round_data(data, participant_id, initial_probs=None, seeds=None):
-    if not data or not participant_id:
-        raise ValueError("No data or participant ID provided for saving.")
-    filename = 'experiment_data_all.csv'
-    # Build per-phase init probabilities map
-    init_map = initial_probs if isinstance(initial_probs, dict) else {}
-    # Append init probs per row based on the row's phase (index 2)
-    data_with_init = []
-    for row in data:
-        try:
-            row_phase = row[2]  # after adding session_id, indexes shift below; adjust later if needed
-        except IndexError:
-            row_phase = None
-        phase_inits = init_map.get(row_phase, {}) if row_phase is not None else {}
-        init_p_safe = phase_inits.get('p_safe', None)
-        init_p_uncertain = phase_inits.get('p_uncertain', None)
-        data_with_init.append(row + [init_p_safe, init_p_uncertain])
-    df = pd.DataFrame(data_with_init, columns=[
-        'session_id', 'participant_id', 'professional_area', 'phase', 'round', 'box_chosen', 'decision_time',
-        'result', 'reward', 'cumulative_earnings', 'p_safe', 'p_uncertain',
-        'init_p_safe', 'init_p_uncertain'
-    ])
+QUESTIONNAIRES_FILE = 'questionnaire_data_all.csv'
+# Columns identifying a row; the write-ahead log drops rows whose key was written before
+RESULTS_KEY = ['session_id', 'participant_id', 'phase', 'round']
+QUESTIONNAIRE_KEY = ['session_id', 'participant_id', 'phase']
+# Columns of SEEDS_FILE
+SEEDS_HEADER = ['session_id', 'participant_id', 'rng_mode', 'phase_order', 'seeds']
+SEEDS_KEY = ['session_id']
+
+def append_dataframe_to_csv(df, filename):
     file_exists = os.path.isfile(filename)
     write_header = not file_exists or os.stat(filename).st_size == 0
     df.to_csv(filename, mode='a', header=write_header, index=False)
-    # Append to Google Sheets via append-only helper
-    append_dataframe_to_sheet(df, worksheet=RESULTS_SHEET)
+
+def build_round_dataframe(data, participant_id, initial_probs=None):
+    """
+    Build the results frame straight from an Experiment's RoundLog, column by column.
+    Session-level constants are broadcast and init probabilities looked up per phase.
+    """
+    wait_for_warmup()
+    import numpy as np
+    import pandas as pd
+    if not data or not participant_id:
+        raise ValueError("No data or participant ID provided for saving.")
+    records = data.records()
+    # Per-phase init probabilities as lookup tables indexed by phase
+    init_map = initial_probs if isinstance(initial_probs, dict) else {}
+    init_p_safe = np.full(max(PHASES) + 1, np.nan)
+    init_p_uncertain = np.full(max(PHASES) + 1, np.nan)
+    for phase, probs in init_map.items():
+        init_p_safe[phase] = probs.get('p_safe', np.nan)
+        init_p_uncertain[phase] = probs.get('p_uncertain', np.nan)
+    phases = records['phase']
+    return pd.DataFrame({
+        'session_id': data.session_id,
+        'participant_id': data.participant_id,
+        'professional_area': data.professional_area,
+        'phase': phases,
+        'round': records['round'],
+        'box_chosen': np.asarray(BOX_CODES)[records['box']],
+        'decision_time': records['decision_time'],
+        'result': np.asarray(RESULT_CODES)[records['result']],
+        'reward': records['reward'],
+        'cumulative_earnings': records['cumulative_earnings'],
+        'p_safe': records['p_safe'],
+        'p_uncertain': records['p_uncertain'],
+        'init_p_safe': init_p_safe[phases],
+        'init_p_uncertain': init_p_uncertain[phases],
+    }, columns=RESULTS_HEADER)
+
+def append_dataframe_to_parquet(df, kind):
+    # Typed columnar copy next to the CSVs; never blocks the CSV and Sheets writes
+    try:
+        columnar.append_partition(df, kind)
+    except Exception as e:
+        print(f"Parquet error appending to {kind}: {e}")
+
+def write_local_copy(df, worksheet):
+    """
+    Append a logged batch to the worksheet's local CSV (and Parquet copy). Returns
+    False if the CSV append failed; the write-ahead log then retries the entry.
+    """
+    filename, kind = {
+        RESULTS_SHEET: (RESULTS_FILE, columnar.RESULTS),
+        QUESTIONNAIRES_SHEET: (QUESTIONNAIRES_FILE, columnar.QUESTIONNAIRES),
+        SEEDS_SHEET: (SEEDS_FILE, None),
+    }[worksheet]
+    try:
+        append_dataframe_to_csv(df, filename)
+    except Exception as e:
+        print(f"CSV error appending to {filename}: {e}")
+        metrics.inc('experiment_csv_errors_total', worksheet=worksheet)
+        return False
+    if kind is not None:
+        append_dataframe_to_parquet(df, kind)
+    return True
+
+@timed('experiment_save_round_data_seconds')
+def write_round_dataframe(df):
+    # Log first, in its own transaction, so a failed Sheets or CSV write is retried from the
+    # log instead of dropped, and duplicates are skipped
+    wal = write_ahead_log()
+    df = wal.append(RESULTS_SHEET, df, RESULTS_KEY)
+    if df.empty:
+        return
+    wal.copy_local(force=True)
+    wal.replay()
+
+def build_seeds_dataframe(data, seeds):
+    """
+    One row with the session's RNG mode, the order its phases were played in and
+    the whole Experiment.get_seeds() dict as JSON.
+    """
+    wait_for_warmup()
+    import json
+    import pandas as pd
+    phase_order = list(dict.fromkeys(int(phase) for phase in data.records()['phase']))
+    return pd.DataFrame([{
+        'session_id': data.session_id,
+        'participant_id': data.participant_id,
+        'rng_mode': seeds.get('rng_mode', ''),
+        'phase_order': json.dumps(phase_order),
+        'seeds': json.dumps(seeds, default=int),
+    }], columns=SEEDS_HEADER)
+
+def write_seeds_dataframe(df):
+    # CSV only: seeds are for offline audits and not worth a Sheets write per session.
+    # Logged all the same, so a failed CSV write is retried and a double submit dropped
+    wal = write_ahead_log()
+    if not wal.append(SEEDS_SHEET, df, SEEDS_KEY).empty:
+        wal.copy_local(force=True)
+
+# Save all phase results to a single CSV file for all participants
+def save_round_data(data, participant_id, initial_probs=None, seeds=None):
+    df = build_round_dataframe(data, participant_id, initial_probs)
+    write_round_dataframe(df)
+    if seeds:
+        write_seeds_dataframe(build_seeds_dataframe(data, seeds))
 
 def get_unique_filename(base, participant_id):
     timestamp = time.strftime('%Y%m%d_%H%M%S')
     return f"{base}_pid{participant_id}_{timestamp}.csv"
 
-def save_questionnaire(participant_id, phase, responses):
+def build_questionnaire_dataframe(participant_id, phase, responses):
+    wait_for_warmup()
+    import pandas as pd
     if not participant_id or not responses:
         raise ValueError("Missing participant ID or responses for questionnaire.")
-    
-    filename = 'questionnaire_data_all.csv'
-    
+
     # Handle batch processing (when responses is a list of questionnaire entries)
     if phase == 'batch' and isinstance(responses, list):
         # Process multiple questionnaire entries at once
@@ -125,37 +313,39 @@ def save_questionnaire(participant_id, phase, responses):
                 if k in QUESTIONNAIRE_HEADER:
                     row_dict[k] = v
             rows_data.append(row_dict)
-        
-        # Create DataFrame with all entries
-        df = pd.DataFrame(rows_data, columns=QUESTIONNAIRE_HEADER)
-        
-        # Prepare data for Google Sheets
-        gsheet_rows = [list(row.values()) for row in rows_data]
-    else:
-        # Handle single entry (legacy support)
-        row_dict = {col: '' for col in QUESTIONNAIRE_HEADER}
-        row_dict['participant_id'] = participant_id
-        row_dict['phase'] = phase
-        for k, v in responses.items():
-            if k in QUESTIONNAIRE_HEADER:
-                row_dict[k] = v
-        df = pd.DataFrame([row_dict], columns=QUESTIONNAIRE_HEADER)
-        gsheet_rows = [list(row_dict.values())]
-    
-    # Save to CSV
-    file_exists = os.path.isfile(filename)
-    write_header = not file_exists or os.stat(filename).st_size == 0
-    df.to_csv(filename, mode='a', header=write_header, index=False)
-    # Append to Google Sheets via append-only helper
-    append_dataframe_to_sheet(df, worksheet=QUESTIONNAIRES_SHEET)
+        return pd.DataFrame(rows_data, columns=QUESTIONNAIRE_HEADER)
+
+    # Handle single entry (legacy support)
+    row_dict = {col: '' for col in QUESTIONNAIRE_HEADER}
+    row_dict['participant_id'] = participant_id
+    row_dict['phase'] = phase
+    for k, v in responses.items():
+        if k in QUESTIONNAIRE_HEADER:
+            row_dict[k] = v
+    return pd.DataFrame([row_dict], columns=QUESTIONNAIRE_HEADER)
+
+@timed('experiment_save_questionnaire_seconds')
+def write_questionnaire_dataframe(df):
+    wal = write_ahead_log()
+    df = wal.append(QUESTIONNAIRES_SHEET, df, QUESTIONNAIRE_KEY)
+    if df.empty:
+        return
+    wal.copy_local(force=True)
+    wal.replay()
+
+def save_questionnaire(participant_id, phase, responses):
+    df = build_questionnaire_dataframe(participant_id, phase, responses)
+    write_questionnaire_dataframe(df)
 
 # Test function to verify data is sent to Google Sheets
 def test_send_data_to_gsheet():
     """
-    Append test rows to both sheets and verify by reading them back (no cache).
+    Append test rows to both sheets and verify by reading the session_id column back (no cache).
     """
+    wait_for_warmup()
     import random
     import string
+    import pandas as pd
 
     # Unique test id to find appended rows
     test_id = 'test_' + ''.join(random.choices(string.ascii_letters + string.digits, k=8))
@@ -183,11 +373,16 @@ def test_send_data_to_gsheet():
     append_dataframe_to_sheet(results_df, worksheet=RESULTS_SHEET)
     append_dataframe_to_sheet(questionnaire_df, worksheet=QUESTIONNAIRES_SHEET)
 
-    # Verify using fresh reads
-    conn = gsheets_conn()
-    results_read = conn.read(worksheet=RESULTS_SHEET, ttl="0")
-    questionnaire_read = conn.read(worksheet=QUESTIONNAIRES_SHEET, ttl="0")
-
-    assert (results_read['session_id'] == test_id).any(), "Appended Results row not found"
-    assert (questionnaire_read['session_id'] == test_id).any(), "Appended Questionnaire row not found"
+    # Verify by reading back only the session_id column
+    assert test_id in read_sheet_column(RESULTS_SHEET, 'session_id'), "Appended Results row not found"
+    assert test_id in read_sheet_column(QUESTIONNAIRES_SHEET, 'session_id'), "Appended Questionnaire row not found"
     print("Google Sheets test PASSED: Append-only writes verified with fresh reads.")
+
+def read_sheet_column(worksheet, column):
+    """Fresh values of one column, without downloading the rest of the worksheet."""
+    conn = gsheets_conn()
+    ws = _select_worksheet(conn, worksheet)
+    if ws is None:
+        return conn.read(worksheet=worksheet, ttl="0")[column].tolist()
+    header = ws.row_values(1)
+    return ws.col_values(header.index(column) + 1)[1:]
@@ -0,0 +1,79 @@
+"""
+Bulk deduplication of the results and questionnaire CSVs.
+
+A row is a duplicate when its key (RESULTS_KEY / QUESTIONNAIRE_KEY in data.py) was
+seen earlier in the file; the first copy is kept. Rows written before session ids
+existed have a blank session_id, so for those only exact copies of a whole row
+count as duplicates. Files are streamed in chunks and replaced atomically.
+
+The keys of the cleaned files are then recorded in the write-ahead log's index, so
+a later write of the same rows is dropped as well.
+
+    python dedup.py
+"""
+import os
+
+import pandas as pd
+
+from data import (
+    RESULTS_FILE, QUESTIONNAIRES_FILE, RESULTS_KEY, QUESTIONNAIRE_KEY,
+    RESULTS_SHEET, QUESTIONNAIRES_SHEET
+)
+from wal import WriteAheadLog, row_keys
+
+DEDUP_CHUNK_ROWS = 100_000
+
+
+def dedup_csv(filename, key_columns, chunk_rows=DEDUP_CHUNK_ROWS):
+    """
+    Remove duplicate rows from filename in place. Returns the set of keys kept (rows
+    with a session id only) and the number of rows removed.
+    """
+    seen = set()
+    kept_keys = set()
+    removed = 0
+    tmp = filename + '.dedup.tmp'
+    with open(tmp, 'w', newline='') as out:
+        header = True
+        # Strings only, so every kept row is written back exactly as it was read
+        for chunk in pd.read_csv(filename, dtype=str, keep_default_na=False, chunksize=chunk_rows):
+            whole_rows = row_keys(chunk, list(chunk.columns))
+            if 'session_id' in chunk:
+                keys, session_ids = row_keys(chunk, key_columns), chunk['session_id']
+            else:
+                keys, session_ids = whole_rows, [''] * len(chunk)
+            keep = []
+            for key, whole_row, session_id in zip(keys, whole_rows, session_ids):
+                if not session_id:
+                    key = whole_row
+                keep.append(key not in seen)
+                seen.add(key)
+                if session_id:
+                    kept_keys.add(key)
+            removed += keep.count(False)
+            chunk[keep].to_csv(out, header=header, index=False)
+            header = False
+    if removed:
+        os.replace(tmp, filename)
+    else:
+        os.remove(tmp)
+    return kept_keys, removed
+
+
+def main():
+    wal = WriteAheadLog()
+    for filename, key_columns, worksheet in ((RESULTS_FILE, RESULTS_KEY, RESULTS_SHEET),
+                                             (QUESTIONNAIRES_FILE, QUESTIONNAIRE_KEY, QUESTIONNAIRES_SHEET)):
+        if not os.path.isfile(filename):
+            continue
+        try:
+            keys, removed = dedup_csv(filename, key_columns)
+        except Exception as e:
+            print(f"Could not deduplicate {filename}: {e}")
+            continue
+        wal.mark_written(worksheet, keys)
+        print(f"{filename}: removed {removed} duplicate rows, indexed {len(keys)} keys")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,46 +1,139 @@
 import numpy as np
 import random
 from constants import *
+from metrics import timed
+from phases import BOX_INDEX, RESULT_INDEX, REWARDS, SPECIAL_PROB, initial_probs
+
+class _LegacyDraw:
+    """Draws from private RandomState/Random instances seeded exactly like the old global calls."""
+
+    def __init__(self, seed):
+        self.np_rng = np.random.RandomState(seed)
+        self.py_rng = random.Random(seed)
+
+    def is_special(self, prob):
+        return self.py_rng.random() < prob
+
+    def special(self):
+        return self.np_rng.choice(['gold', 'silver'])
+
+    def colour(self, prob):
+        return self.np_rng.choice(['red', 'black'], p=[prob, 1 - prob])
+
+
+class _UniformDraw:
+    """Draws from three uniform variates: special decision, special colour, red/black."""
+
+    def __init__(self, uniforms):
+        self.uniforms = uniforms
+
+    def is_special(self, prob):
+        return self.uniforms[0] < prob
+
+    def special(self):
+        return 'gold' if self.uniforms[1] < 0.5 else 'silver'
+
+    def colour(self, prob):
+        return 'red' if self.uniforms[2] < prob else 'black'
+
+
+# One row per round; box and result are stored as indexes into BOX_CODES/RESULT_CODES
+ROUND_LOG_DTYPE = np.dtype([
+    ('phase', 'i1'), ('round', 'i1'), ('box', 'i1'), ('decision_time', 'f8'),
+    ('result', 'i1'), ('reward', 'i2'), ('cumulative_earnings', 'i4'),
+    ('p_safe', 'f8'), ('p_uncertain', 'f8'),
+])
+
+
+class RoundLog:
+    """
+    Preallocated round log for one session. Session-level constants are stored once
+    instead of on every row.
+    """
+    __slots__ = ('session_id', 'participant_id', 'professional_area', 'rows', 'size')
+
+    def __init__(self, participant_id, session_id='', professional_area='',
+                 capacity=len(PHASES) * ROUNDS_PER_PHASE):
+        self.session_id = session_id
+        self.participant_id = participant_id
+        self.professional_area = professional_area
+        self.rows = np.zeros(capacity, dtype=ROUND_LOG_DTYPE)
+        self.size = 0
+
+    def append(self, phase, rnd, box, decision_time, result, reward, cumulative_earnings, p_safe, p_uncertain):
+        if self.size == len(self.rows):
+            self.rows = np.resize(self.rows, 2 * len(self.rows))
+        self.rows[self.size] = (
+            phase, rnd, BOX_CODES.index(box), decision_time, RESULT_CODES.index(result),
+            reward, cumulative_earnings, p_safe, p_uncertain
+        )
+        self.size += 1
+
+    def __len__(self):
+        return self.size
+
+    def records(self):
+        return self.rows[:self.size]
+
+    def phase_history(self, phase):
+        """Rounds and cumulative earnings logged so far in the given phase."""
+        records = self.records()
+        in_phase = records[records['phase'] == phase]
+        return in_phase['round'], in_phase['cumulative_earnings']
+
 
 class Experiment:
-    def __init__(self, participant_id, phase_order=None):
+    __slots__ = (
+        'participant_id', 'rng_mode', 'seeds', 'initial_probs', 'schedules', 'phase_order',
+        'phase', 'round', 'cumulative_earnings', 'p_safe', 'p_uncertain', 'log'
+    )
+
+    def __init__(self, participant_id, phase_order=None, rng_mode=RNG_MODE,
+                 session_id='', professional_area=''):
         self.participant_id = participant_id
-        self.seeds = {}  # Initialize before any method uses it
+        self.rng_mode = rng_mode
+        self.seeds = {'rng_mode': rng_mode}  # Initialize before any method uses it
         self.initial_probs = {}  # Initialize before any method uses it
+        self.schedules = {}  # Pre-generated uniforms per phase in 'schedule' mode
         self.phase_order = phase_order or self.randomize_phases()
         self.reset_for_phase(self.phase_order[0])
         self.cumulative_earnings = 0
         self.round = 1
-        self.data = []
+        self.log = RoundLog(participant_id, session_id, professional_area)
+
+    @property
+    def data(self):
+        return self.log
 
     def randomize_phases(self):
         phases = PHASES.copy()
-        random.seed(self.participant_id)
-        random.shuffle(phases)
+        # Private Random instance: same order as the old global seed, without the race
+        random.Random(self.participant_id).shuffle(phases)
         self.seeds['phase_order'] = self.participant_id
         return phases
 
     def reset_for_phase(self, phase):
-        phase_seed = self.participant_id + phase
-        np.random.seed(phase_seed)
-        random.seed(phase_seed)
+        if self.rng_mode == 'legacy':
+            phase_seed = self.participant_id + phase
+            rng = np.random.RandomState(phase_seed)
+        else:
+            phase_seed = [self.participant_id, phase]
+            rng = np.random.default_rng(phase_seed)
         self.seeds[f'phase_{phase}'] = phase_seed
         self.phase = phase
         self.round = 1
         self.cumulative_earnings = 0
-        if phase == 1:
-            self.p_safe = SAFE_PROB_INIT
-            self.p_uncertain = float(np.random.uniform(UNCERTAIN_PROB_MIN, UNCERTAIN_PROB_MAX))
-        elif phase == 2:
-            self.p_safe = SAFE_PROB_INIT
-            self.p_uncertain = float(np.random.uniform(0.3, 0.7))
-        elif phase == 3:
-            self.p_safe = float(np.random.uniform(0.2, 0.8))
-            self.p_uncertain = float(np.random.uniform(0.3, 0.7))
+        p_safe, p_uncertain = initial_probs(phase, rng)
+        self.p_safe, self.p_uncertain = float(p_safe), float(p_uncertain)
         self.initial_probs[phase] = {
             'p_safe': self.p_safe,
             'p_uncertain': self.p_uncertain
         }
+        if self.rng_mode == 'schedule':
+            # One row per round: special decision, special colour, red/black
+            self.schedules[phase] = np.stack([
+                self._round_uniforms(phase, rnd) for rnd in range(1, ROUNDS_PER_PHASE + 1)
+            ])
 
     def adjust_probabilities(self, box_chosen):
         if box_chosen == 'A':
@@ -50,52 +143,94 @@ class Experiment:
             self.p_safe = min(PROB_LIMIT_MAX, self.p_safe + PROB_ADJUST)
             self.p_uncertain = max(PROB_LIMIT_MIN, self.p_uncertain - PROB_ADJUST)
 
-    def draw_ball(self, box_chosen):
-        special = None
+    def _round_uniforms(self, phase, rnd):
+        return np.random.default_rng([self.participant_id, phase, rnd]).random(3)
+
+    def _round_seed(self, phase, rnd):
+        if self.rng_mode == 'legacy':
+            return self.participant_id + phase * 1000 + rnd
+        return [self.participant_id, phase, rnd]
+
+    def _round_draw(self):
         # Log the random seed for this round (for full reproducibility)
-        round_seed = self.participant_id + self.phase * 1000 + self.round
-        np.random.seed(round_seed)
-        random.seed(round_seed)
+        round_seed = self._round_seed(self.phase, self.round)
+        if self.rng_mode == 'legacy':
+            draw = _LegacyDraw(round_seed)
+        elif self.rng_mode == 'schedule':
+            draw = _UniformDraw(self.schedules[self.phase][self.round - 1])
+        else:
+            draw = _UniformDraw(self._round_uniforms(self.phase, self.round))
         self.seeds[f'phase_{self.phase}_round_{self.round}'] = round_seed
-        if self.phase == 1:
-            prob = self.p_safe if box_chosen == 'A' else self.p_uncertain
-            result = np.random.choice(['red', 'black'], p=[prob, 1 - prob])
-            if box_chosen == 'A':
-                reward = REWARD_RED if result == 'red' else REWARD_BLACK
-            else:
-                reward = AMBIGUITY_REWARD if result == 'red' else AMBIGUITY_LOSS
-        elif self.phase == 2:
-            if box_chosen == 'A':
-                prob = self.p_safe
-                result = np.random.choice(['red', 'black'], p=[prob, 1 - prob])
-                reward = REWARD_RED if result == 'red' else REWARD_BLACK
-            else:
-                prob = self.p_uncertain
-                if random.random() < RUMSFELD_SPECIAL_PROB_PHASE3:
-                    special = np.random.choice(['gold', 'silver'])
-                    result = special
-                    reward = REWARD_GOLD if special == 'gold' else REWARD_SILVER
-                else:
-                    result = np.random.choice(['red', 'black'], p=[prob, 1 - prob])
-                    reward = REWARD_RED if result == 'red' else REWARD_BLACK
-        elif self.phase == 3:
-            if box_chosen == 'A':
-                prob = self.p_safe
-                result = np.random.choice(['red', 'black'], p=[prob, 1 - prob])
-                reward = AMBIGUITY_REWARD if result == 'red' else AMBIGUITY_LOSS
-            else:
-                prob = self.p_uncertain
-                if random.random() < RUMSFELD_SPECIAL_PROB_PHASE3:
-                    special = np.random.choice(['gold', 'silver'])
-                    result = special
-                    reward = REWARD_GOLD if special == 'gold' else REWARD_SILVER
-                else:
-                    result = np.random.choice(['red', 'black'], p=[prob, 1 - prob])
-                    reward = REWARD_RED if result == 'red' else REWARD_BLACK
+        return draw
+
+    @timed('experiment_draw_ball_seconds')
+    def draw_ball(self, box_chosen):
+        special = None
+        draw = self._round_draw()
+        box = BOX_INDEX[box_chosen]
+        prob = self.p_uncertain if box else self.p_safe
+        special_prob = SPECIAL_PROB[self.phase, box]
+        if special_prob and draw.is_special(special_prob):
+            special = draw.special()
+            result = special
+        else:
+            result = draw.colour(prob)
+        reward = int(REWARDS[self.phase, box, RESULT_INDEX[result]])
         return result, reward, special
 
+    def log_round(self, box_chosen, decision_time, result, reward):
+        """Record the current round; call after updating cumulative_earnings, before adjusting probabilities."""
+        self.log.append(
+            self.phase, self.round, box_chosen, round(decision_time, 3), result, reward,
+            self.cumulative_earnings, round(self.p_safe, 3), round(self.p_uncertain, 3)
+        )
+
+    def restore(self, rounds, phase):
+        """
+        Bring a new Experiment to where an interrupted session stopped. rounds are the
+        stored (phase, round, box, decision_time, result, reward, cumulative_earnings,
+        p_safe, p_uncertain) rows in play order; phase is the phase in progress.
+        Draws are not repeated: phases are reset from their seeds and the current
+        phase's probabilities are walked forward through the logged choices.
+        """
+        for played in self.phase_order[:self.phase_order.index(phase) + 1]:
+            self.reset_for_phase(played)
+        current = []
+        for row in rounds:
+            self.log.append(*row)
+            self.seeds[f'phase_{row[0]}_round_{row[1]}'] = self._round_seed(row[0], row[1])
+            if row[0] == phase:
+                current.append(row)
+        for row in current:
+            self.adjust_probabilities(row[2])
+        if current:
+            self.cumulative_earnings = current[-1][6]
+            # After the last round the app stays on round ROUNDS_PER_PHASE for the questionnaire
+            self.round = min(current[-1][1] + 1, ROUNDS_PER_PHASE)
+        return len(current)
+
     def get_initial_probs(self):
         return self.initial_probs
 
     def get_seeds(self):
         return self.seeds
+
+    def export_schedule(self):
+        """
+        Return the pre-generated draws of every phase reset so far, one dict per round.
+        A round's outcome follows from comparing these uniforms with the logged
+        p_safe/p_uncertain, without re-running the RNG.
+        """
+        rows = []
+        for phase, schedule in self.schedules.items():
+            for rnd, (u_special, u_special_colour, u_colour) in enumerate(schedule, start=1):
+                rows.append({
+                    'participant_id': self.participant_id,
+                    'phase': phase,
+                    'round': rnd,
+                    'seed': [self.participant_id, phase, rnd],
+                    'u_special': float(u_special),
+                    'u_special_colour': float(u_special_colour),
+                    'u_colour': float(u_colour),
+                })
+        return rows
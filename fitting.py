@@ -0,0 +1,214 @@
+"""
+Per-session maximum-likelihood fits of choice models to experiment_data_all.csv.
+
+Models, fitted to the box_chosen sequence of each session:
+- softmax_ev: P(A) = sigmoid(beta * (V_A - V_B)). A box shown with its balls is
+  valued at its expected value under the logged p_safe/p_uncertain; a box with
+  unknown probability at the alpha-maxmin value alpha * loss + (1 - alpha) * win,
+  so alpha = 0.5 is ambiguity neutral and higher alpha is ambiguity averse.
+- wsls: win-stay/lose-shift with p_stay_win and p_shift_lose, within each phase.
+- random: P(A) = 0.5, the baseline with no parameters.
+
+Fits are cached by session_id and a session is only refitted when it is new or
+its number of rows changed. Rows logged before session ids existed are grouped
+by participant as 'participant-<id>'.
+
+    python fitting.py [experiment_data_all.csv]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from constants import RESULTS_FILE
+from parallel import run_chunked
+from phases import DISPLAY, DISPLAY_MODES, REWARDS
+from streaming import iter_results
+
+FITS_FILE = 'experiment_fits.csv'
+FIT_COLUMNS = [
+    'session_id', 'participant_id', 'professional_area', 'n_rounds',
+    'softmax_beta', 'softmax_alpha', 'softmax_loglik', 'softmax_aic',
+    'wsls_p_stay_win', 'wsls_p_shift_lose', 'wsls_loglik', 'wsls_aic',
+    'random_loglik', 'best_model',
+]
+BETA_MAX = 5.0  # Inverse temperature per euro; larger is indistinguishable from argmax
+GRID_POINTS = 41  # Per parameter on the first grid; each refinement zooms into the best cell
+GRID_REFINEMENTS = 3
+KNOWN = DISPLAY_MODES.index('known')
+
+
+def session_arrays(rows):
+    """Arrays of one session's rounds in play order, as the models see them."""
+    phase = rows['phase'].to_numpy(np.intp)
+    box = (rows['box_chosen'] == 'B').to_numpy(np.intp)
+    return {
+        'phase': phase,
+        'round': rows['round'].to_numpy(np.intp),
+        'box': box,
+        'reward': rows['reward'].to_numpy(np.float64),
+        'p': np.stack([rows['p_safe'].to_numpy(np.float64), rows['p_uncertain'].to_numpy(np.float64)], axis=1),
+    }
+
+
+def _value_terms(arrays):
+    """
+    V_A - V_B as c0 + c1 * alpha per round: known boxes contribute their expected
+    value, unknown ones win - alpha * (win - loss).
+    """
+    phase = arrays['phase']
+    c0 = np.zeros(len(phase))
+    c1 = np.zeros(len(phase))
+    for b, sign in ((0, 1), (1, -1)):
+        win = REWARDS[phase, b, 0].astype(np.float64)
+        loss = REWARDS[phase, b, 1].astype(np.float64)
+        p = arrays['p'][:, b]
+        known = DISPLAY[phase, b] == KNOWN
+        c0 += sign * np.where(known, p * win + (1 - p) * loss, win)
+        c1 += sign * np.where(known, 0.0, loss - win)
+    return c0, c1
+
+
+def softmax_ev_loglik(arrays, beta, alpha, terms=None):
+    """Log-likelihood of the choices; beta and alpha broadcast against each other."""
+    c0, c1 = terms if terms is not None else _value_terms(arrays)
+    beta = np.asarray(beta, dtype=np.float64)[..., None]
+    alpha = np.asarray(alpha, dtype=np.float64)[..., None]
+    logits = beta * (c0 + c1 * alpha)
+    # log P(A) = -log(1 + e^-x) and log P(B) = -log(1 + e^x)
+    signed = np.where(arrays['box'] == 0, -logits, logits)
+    return -np.logaddexp(0.0, signed).sum(axis=-1)
+
+
+def fit_softmax_ev(arrays):
+    """Grid search over (beta, alpha), zooming into the best cell GRID_REFINEMENTS times."""
+    terms = _value_terms(arrays)
+    beta_lo, beta_hi, alpha_lo, alpha_hi = 0.0, BETA_MAX, 0.0, 1.0
+    for _ in range(GRID_REFINEMENTS + 1):
+        betas = np.linspace(beta_lo, beta_hi, GRID_POINTS)
+        alphas = np.linspace(alpha_lo, alpha_hi, GRID_POINTS)
+        loglik = softmax_ev_loglik(arrays, betas[:, None], alphas[None, :], terms)
+        i, j = np.unravel_index(np.argmax(loglik), loglik.shape)
+        beta, alpha, best = betas[i], alphas[j], loglik[i, j]
+        beta_step, alpha_step = betas[1] - betas[0], alphas[1] - alphas[0]
+        beta_lo, beta_hi = max(0.0, beta - beta_step), min(BETA_MAX, beta + beta_step)
+        alpha_lo, alpha_hi = max(0.0, alpha - alpha_step), min(1.0, alpha + alpha_step)
+    return float(beta), float(alpha), float(best)
+
+
+def _bernoulli_loglik(successes, trials):
+    # Closed-form maximum of k log p + (n - k) log(1 - p), with 0 log 0 = 0
+    if not trials:
+        return np.nan, 0.0
+    p = successes / trials
+    loglik = sum(k * np.log(q) for k, q in ((successes, p), (trials - successes, 1 - p)) if k)
+    return float(p), float(loglik)
+
+
+def fit_wsls(arrays):
+    """
+    Win-stay/lose-shift: after a positive reward the previous box is kept with
+    p_stay_win, otherwise switched with p_shift_lose. The first round of each phase
+    is a coin flip.
+    """
+    box, phase, rnd = arrays['box'], arrays['phase'], arrays['round']
+    follows = np.zeros(len(box), dtype=bool)
+    follows[1:] = (phase[1:] == phase[:-1]) & (rnd[1:] == rnd[:-1] + 1)
+    won = np.zeros(len(box), dtype=bool)
+    won[1:] = arrays['reward'][:-1] > 0
+    stayed = np.zeros(len(box), dtype=bool)
+    stayed[1:] = box[1:] == box[:-1]
+    after_win, after_loss = follows & won, follows & ~won
+    p_stay_win, ll_win = _bernoulli_loglik(int(stayed[after_win].sum()), int(after_win.sum()))
+    p_shift_lose, ll_loss = _bernoulli_loglik(int((~stayed[after_loss]).sum()), int(after_loss.sum()))
+    loglik = ll_win + ll_loss + (~follows).sum() * np.log(0.5)
+    return p_stay_win, p_shift_lose, float(loglik)
+
+
+def fit_session(session_id, participant_id, professional_area, arrays):
+    """One FIT_COLUMNS row for a session."""
+    beta, alpha, softmax_ll = fit_softmax_ev(arrays)
+    p_stay_win, p_shift_lose, wsls_ll = fit_wsls(arrays)
+    n = len(arrays['box'])
+    random_ll = n * np.log(0.5)
+    aic = {'softmax_ev': 4 - 2 * softmax_ll, 'wsls': 4 - 2 * wsls_ll, 'random': -2 * random_ll}
+    return {
+        'session_id': session_id, 'participant_id': participant_id,
+        'professional_area': professional_area, 'n_rounds': n,
+        'softmax_beta': beta, 'softmax_alpha': alpha, 'softmax_loglik': softmax_ll,
+        'softmax_aic': aic['softmax_ev'],
+        'wsls_p_stay_win': p_stay_win, 'wsls_p_shift_lose': p_shift_lose, 'wsls_loglik': wsls_ll,
+        'wsls_aic': aic['wsls'],
+        'random_loglik': float(random_ll), 'best_model': min(aic, key=aic.get),
+    }
+
+
+def _fit_chunk(chunk):
+    return [fit_session(*task) for task in chunk]
+
+
+def load_sessions(path=RESULTS_FILE):
+    """session key -> (participant_id, professional_area, rows) in file order."""
+    columns = ['session_id', 'participant_id', 'professional_area', 'phase', 'round',
+               'box_chosen', 'reward', 'p_safe', 'p_uncertain']
+    frames = [batch[columns] for batch in iter_results(path)]
+    if not frames:
+        return {}
+    df = pd.concat(frames, ignore_index=True)
+    key = df['session_id'].astype(object).where(
+        df['session_id'].notna() & (df['session_id'] != ''),
+        'participant-' + df['participant_id'].astype(str)
+    )
+    return {
+        session_id: (int(rows['participant_id'].iloc[0]), str(rows['professional_area'].iloc[0]), rows)
+        for session_id, rows in df.groupby(key, sort=False, observed=True)
+    }
+
+
+def load_fits(cache_path=FITS_FILE):
+    if not os.path.isfile(cache_path):
+        return pd.DataFrame(columns=FIT_COLUMNS)
+    try:
+        return pd.read_csv(cache_path, dtype={'session_id': str})
+    except Exception as e:
+        print(f"Ignoring unreadable fits cache {cache_path}: {e}")
+        return pd.DataFrame(columns=FIT_COLUMNS)
+
+
+def fit_all(path=RESULTS_FILE, cache_path=FITS_FILE, max_workers=None, chunk_size=None):
+    """
+    Fit every session in path, reusing cached fits of sessions whose row count is
+    unchanged, fitting the rest across a process pool, and rewriting the cache.
+    Returns the fits of all sessions currently in the file and how many were fitted.
+    """
+    sessions = load_sessions(path)
+    cached = load_fits(cache_path)
+    cached_rounds = dict(zip(cached['session_id'], cached['n_rounds']))
+    tasks = [
+        (session_id, participant_id, area, session_arrays(rows))
+        for session_id, (participant_id, area, rows) in sessions.items()
+        if cached_rounds.get(session_id) != len(rows)
+    ]
+    fitted = [row for rows in run_chunked(_fit_chunk, tasks, max_workers, chunk_size) for row in rows]
+
+    refitted = {row['session_id'] for row in fitted}
+    kept = cached[cached['session_id'].isin(sessions) & ~cached['session_id'].isin(refitted)]
+    fits = pd.concat([kept, pd.DataFrame(fitted, columns=FIT_COLUMNS)], ignore_index=True).infer_objects()
+    order = {session_id: i for i, session_id in enumerate(sessions)}
+    fits = fits.sort_values('session_id', key=lambda s: s.map(order), ignore_index=True)[FIT_COLUMNS]
+    tmp = cache_path + '.tmp'
+    fits.to_csv(tmp, index=False)
+    os.replace(tmp, cache_path)
+    return fits, len(tasks)
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else RESULTS_FILE
+    started = time.perf_counter()
+    fits, refitted = fit_all(path)
+    print(f"{len(fits)} sessions, {refitted} fitted in {time.perf_counter() - started:.2f}s")
+    if len(fits):
+        print(fits.groupby('best_model').size().rename('sessions'))
+        print(fits[['softmax_beta', 'softmax_alpha', 'wsls_p_stay_win', 'wsls_p_shift_lose']].describe())
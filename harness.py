@@ -0,0 +1,104 @@
+import itertools
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from constants import *
+from experiment import Experiment
+from parallel import run_chunked
+from strategies import STRATEGIES, observable_state
+
+HARNESS_COLUMNS = [
+    'strategy', 'session_id', 'participant_id', 'phase_order', 'phase', 'round', 'box_chosen',
+    'result', 'reward', 'cumulative_earnings', 'p_safe', 'p_uncertain'
+]
+
+
+def run_session(strategy_name, participant_id, phase_order=None, params=None, rng_mode=RNG_MODE):
+    """
+    Play one full session of the real Experiment with a strategy agent. Returns the
+    rows as a list of tuples in HARNESS_COLUMNS order.
+    """
+    params = params or {}
+    agent_index = list(STRATEGIES).index(strategy_name)
+    agent = STRATEGIES[strategy_name](rng=np.random.default_rng([participant_id, agent_index]), **params)
+    exp = Experiment(participant_id, phase_order=list(phase_order) if phase_order else None, rng_mode=rng_mode)
+    order = ''.join(str(p) for p in exp.phase_order)
+    session_id = f"{strategy_name}-{participant_id}-{order}"
+    rows = []
+    for phase in exp.phase_order:
+        exp.reset_for_phase(phase)
+        agent.start_phase(phase)
+        history = []
+        for _ in range(ROUNDS_PER_PHASE):
+            box = agent.choose(observable_state(exp), history)
+            result, reward, special = exp.draw_ball(box)
+            exp.cumulative_earnings += reward
+            rows.append((
+                strategy_name, session_id, participant_id, order, phase, exp.round, box,
+                str(result), reward, exp.cumulative_earnings, round(exp.p_safe, 3), round(exp.p_uncertain, 3)
+            ))
+            exp.adjust_probabilities(box)
+            agent.update(box, result, reward)
+            history.append((box, result, reward))
+            exp.round += 1
+    return rows
+
+
+def _run_chunk(tasks):
+    rows = []
+    for task in tasks:
+        rows.extend(run_session(*task))
+    # Ship columns rather than row tuples to keep the result pickle small
+    return pd.DataFrame(rows, columns=HARNESS_COLUMNS)
+
+
+def build_tasks(strategies, participant_ids, phase_orders=None, params=None, rng_mode=RNG_MODE):
+    """
+    One task per strategy x participant x phase order. phase_orders=None keeps each
+    participant's own randomized order; 'all' runs every permutation of PHASES.
+    """
+    params = params or {}
+    if phase_orders == 'all':
+        phase_orders = list(itertools.permutations(PHASES))
+    orders = phase_orders or [None]
+    return [
+        (name, pid, order, params.get(name), rng_mode)
+        for name in strategies for pid in participant_ids for order in orders
+    ]
+
+
+def run_harness(strategies, participant_ids, phase_orders=None, params=None, rng_mode=RNG_MODE,
+                max_workers=None, chunk_size=None):
+    """
+    Run every strategy x participant x phase order across a process pool and merge
+    the results into one DataFrame. Tasks are sent in chunks so per-task IPC
+    overhead does not limit scaling.
+    """
+    tasks = build_tasks(strategies, participant_ids, phase_orders, params, rng_mode)
+    frames = run_chunked(_run_chunk, tasks, max_workers, chunk_size)
+    if not frames:
+        return pd.DataFrame(columns=HARNESS_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def summarize(results):
+    """Mean final earnings per strategy and phase, and the share of Box A choices."""
+    final = results[results['round'] == ROUNDS_PER_PHASE]
+    return pd.DataFrame({
+        'final_earnings': final.groupby(['strategy', 'phase'])['cumulative_earnings'].mean(),
+        'share_box_a': results.assign(a=results['box_chosen'] == 'A').groupby(['strategy', 'phase'])['a'].mean(),
+    })
+
+
+if __name__ == '__main__':
+    participant_ids = range(1, 401)
+    for workers in sorted({1, 2, os.cpu_count() or 1}):
+        started = time.perf_counter()
+        results = run_harness(list(STRATEGIES), participant_ids, max_workers=workers)
+        elapsed = time.perf_counter() - started
+        sessions = results['session_id'].nunique()
+        print(f"{workers} workers: {sessions} sessions in {elapsed:.2f}s ({sessions / elapsed:.0f} sessions/s)")
+    print(summarize(results))
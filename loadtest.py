@@ -0,0 +1,137 @@
+"""
+Headless load test for the Streamlit flow in main.py.
+
+Drives N concurrent sessions through welcome -> enter_id -> instructions -> rounds ->
+questionnaire -> debrief -> thank_you with Streamlit's AppTest, with Google Sheets
+replaced by the SQLite stand-in from local_sheets.py and every file written to a
+temporary directory. Sheets latency and quota errors can be injected to see how
+throughput and the write-ahead log's retries hold up.
+
+AppTest swaps process-global runtime state on every run, so reruns are serialised
+with a lock. That matches one server process, where script threads share the GIL;
+time spent waiting for the lock is counted in the rerun latency.
+
+    python loadtest.py --concurrency 1 2 4 8 --sessions 2
+    python loadtest.py --concurrency 4 --latency 0.5 --quota 60 --error-rate 0.05
+"""
+import argparse
+import os
+import resource
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from streamlit.testing.v1 import AppTest
+
+import data
+import metrics
+from constants import ROUNDS_PER_PHASE, PHASES
+from local_sheets import LocalSheetsConnection
+from writer import get_writer
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+RERUN_TIMEOUT = 60
+_apptest_lock = threading.Lock()
+
+
+def _click(at, label):
+    next(b for b in at.button if b.label == label).click()
+
+
+def run_session(index, latencies):
+    """Play one participant through the whole app. Returns the number of rounds played."""
+    rng = np.random.default_rng(index)
+    at = AppTest.from_file(APP_FILE, default_timeout=RERUN_TIMEOUT)
+
+    def rerun():
+        started = time.perf_counter()
+        with _apptest_lock:
+            at.run()
+        latencies.append(time.perf_counter() - started)
+        if at.exception:
+            raise RuntimeError(f"Session {index} failed: {at.exception[0].message}")
+
+    rerun()
+    _click(at, 'Start')
+    rerun()
+    at.text_input(key='participant_id_input').input(str(10000 + index))
+    at.selectbox(key='professional_area_input').select('Student')
+    _click(at, 'Start Experiment')
+    rerun()
+    rounds = 0
+    for _ in PHASES:
+        _click(at, 'Begin Rounds')
+        rerun()
+        for _ in range(ROUNDS_PER_PHASE):
+            _click(at, 'Box A' if rng.random() < 0.5 else 'Box B')
+            rerun()
+            rounds += 1
+        _click(at, 'Submit Questionnaire & Start Next Phase')
+        rerun()
+    _click(at, 'Submit Final Feedback & Complete Experiment')
+    rerun()
+    if at.session_state['step'] != 'thank_you':
+        raise RuntimeError(f"Session {index} ended on step {at.session_state['step']}")
+    return rounds
+
+
+def run_load(concurrency, sessions_per_worker=1, first_index=0):
+    latencies = []
+    total = concurrency * sessions_per_worker
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        rounds = sum(pool.map(lambda i: run_session(first_index + i, latencies), range(total)))
+    elapsed = time.perf_counter() - started
+    ms = np.array(latencies) * 1000
+    return {
+        'concurrency': concurrency,
+        'sessions': total,
+        'reruns': len(latencies),
+        'p50_ms': np.percentile(ms, 50),
+        'p95_ms': np.percentile(ms, 95),
+        'p99_ms': np.percentile(ms, 99),
+        'rounds_per_s': rounds / elapsed,
+        # ru_maxrss is in kilobytes on Linux and never decreases
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--sessions', type=int, default=1, help='sessions per concurrent worker')
+    parser.add_argument('--metrics-file', help='write the Prometheus metrics of the run here')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every Sheets request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random 0..jitter seconds per request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='chance a Sheets request fails with a quota error')
+    parser.add_argument('--quota', type=int, default=0, help='Sheets reads and writes allowed per minute (0: unlimited)')
+    args = parser.parse_args()
+
+    metrics_file = os.path.abspath(args.metrics_file) if args.metrics_file else None
+    os.chdir(tempfile.mkdtemp(prefix='loadtest-'))
+    sheets = LocalSheetsConnection(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, quota_per_minute=args.quota
+    )
+    data.gsheets_conn = lambda: sheets
+
+    reports = []
+    first_index = 0
+    for concurrency in sorted(args.concurrency):
+        reports.append(run_load(concurrency, args.sessions, first_index))
+        first_index += concurrency * args.sessions
+    get_writer().drain()
+    print(pd.DataFrame(reports).round(1).to_string(index=False))
+    print(f"Write-behind queue: {get_writer().stats()}")
+    print(f"Sheets requests: {sheets.requests}, injected errors: {sheets.errors}, "
+          f"entries left in the write-ahead log: {data.write_ahead_log().pending()}")
+    print(f"Stored rows: {sheets.row_count(data.RESULTS_SHEET)} results, "
+          f"{sheets.row_count(data.QUESTIONNAIRES_SHEET)} questionnaire")
+    if metrics_file:
+        metrics.write_file(metrics_file)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+SQLite-backed stand-in for the Google Sheets connection, for offline load tests.
+
+Implements the surface data.py uses: read(worksheet, ttl) / update(worksheet, data)
+on the connection, and row_values / col_values / update / append_rows on the
+worksheet returned by client._select_worksheet(). Appends insert only the new rows.
+
+Latency and quota errors can be injected to mimic the Sheets API:
+
+    SHEETS_BACKEND=local LOCAL_SHEETS_LATENCY=0.3 LOCAL_SHEETS_QUOTA_PER_MINUTE=60 streamlit run main.py
+"""
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from wal import _json_default
+
+LOCAL_SHEETS_FILE = os.environ.get('LOCAL_SHEETS_FILE', 'local_sheets.sqlite3')
+LOCAL_SHEETS_LATENCY = float(os.environ.get('LOCAL_SHEETS_LATENCY', 0))  # Seconds added to every call
+LOCAL_SHEETS_JITTER = float(os.environ.get('LOCAL_SHEETS_JITTER', 0))  # Extra uniform 0..jitter seconds
+LOCAL_SHEETS_ERROR_RATE = float(os.environ.get('LOCAL_SHEETS_ERROR_RATE', 0))  # Chance a call fails with a quota error
+# Requests allowed per minute for reads and for writes, like the Sheets per-user quota; 0 is unlimited
+LOCAL_SHEETS_QUOTA_PER_MINUTE = int(os.environ.get('LOCAL_SHEETS_QUOTA_PER_MINUTE', 0))
+
+
+class QuotaExceeded(Exception):
+    """Raised where the Sheets API would answer 429 RESOURCE_EXHAUSTED."""
+
+
+class _Quota:
+    """Fixed one-minute window per request kind."""
+
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self.lock = threading.Lock()
+        self.windows = {}  # kind -> (window start, requests)
+
+    def take(self, kind):
+        if not self.per_minute:
+            return
+        now = time.monotonic()
+        with self.lock:
+            start, used = self.windows.get(kind, (now, 0))
+            if now - start >= 60:
+                start, used = now, 0
+            if used >= self.per_minute:
+                raise QuotaExceeded(f"429 RESOURCE_EXHAUSTED: quota of {self.per_minute} {kind} requests per minute exceeded")
+            self.windows[kind] = (start, used + 1)
+
+
+class LocalWorksheet:
+    """One worksheet; row 1 is the header, as in Sheets."""
+
+    def __init__(self, conn, title):
+        self.conn = conn
+        self.title = title
+
+    def row_values(self, row):
+        self.conn._request('read')
+        with self.conn._connect() as db:
+            found = db.execute(
+                "SELECT cells FROM cells WHERE worksheet = ? AND row = ?", (self.title, row)
+            ).fetchone()
+        return json.loads(found[0]) if found else []
+
+    def col_values(self, col):
+        self.conn._request('read')
+        with self.conn._connect() as db:
+            rows = db.execute(
+                "SELECT cells FROM cells WHERE worksheet = ? ORDER BY row", (self.title,)
+            ).fetchall()
+        values = [json.loads(cells) for (cells,) in rows]
+        return [v[col - 1] if len(v) >= col else '' for v in values]
+
+    def update(self, range_name, values):
+        # Only the header update (range 'A1') is used by data.py
+        if range_name != 'A1' or len(values) != 1:
+            raise NotImplementedError(f"LocalWorksheet.update only supports a single row at A1, got {range_name}")
+        self.conn._request('write')
+        with self.conn._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO cells (worksheet, row, cells) VALUES (?, 1, ?)",
+                (self.title, json.dumps(list(values[0])))
+            )
+
+    def append_rows(self, values, value_input_option=None, table_range=None):
+        self.conn._request('write')
+        with self.conn._connect() as db:
+            last = db.execute(
+                "SELECT COALESCE(MAX(row), 1) FROM cells WHERE worksheet = ?", (self.title,)
+            ).fetchone()[0]
+            db.executemany(
+                "INSERT INTO cells (worksheet, row, cells) VALUES (?, ?, ?)",
+                ((self.title, last + i, json.dumps(list(v), default=_json_default)) for i, v in enumerate(values, start=1))
+            )
+
+
+class LocalSheetsConnection:
+    """Drop-in for st.connection('gsheets', type=GSheetsConnection) backed by one SQLite file."""
+
+    def __init__(self, path=LOCAL_SHEETS_FILE, latency=LOCAL_SHEETS_LATENCY, jitter=LOCAL_SHEETS_JITTER,
+                 error_rate=LOCAL_SHEETS_ERROR_RATE, quota_per_minute=LOCAL_SHEETS_QUOTA_PER_MINUTE):
+        self.path = path
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.quota = _Quota(quota_per_minute)
+        self.client = self
+        self._lock = threading.Lock()
+        self.requests = {'read': 0, 'write': 0}
+        self.errors = 0
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS cells ("
+                "worksheet TEXT NOT NULL, row INTEGER NOT NULL, cells TEXT NOT NULL, "
+                "PRIMARY KEY (worksheet, row))"
+            )
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _request(self, kind):
+        """Apply the injected latency and failures to one API request."""
+        with self._lock:
+            self.requests[kind] += 1
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+        try:
+            self.quota.take(kind)
+            if self.error_rate and random.random() < self.error_rate:
+                raise QuotaExceeded("429 RESOURCE_EXHAUSTED: injected quota error")
+        except QuotaExceeded:
+            with self._lock:
+                self.errors += 1
+            raise
+
+    # --- gspread client surface ---
+    def _select_worksheet(self, worksheet):
+        return LocalWorksheet(self, worksheet)
+
+    # --- GSheetsConnection surface ---
+    def read(self, worksheet, ttl=None):
+        import pandas as pd
+        self._request('read')
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT cells FROM cells WHERE worksheet = ? ORDER BY row", (worksheet,)
+            ).fetchall()
+        if not rows:
+            return pd.DataFrame()
+        header, *body = [json.loads(cells) for (cells,) in rows]
+        return pd.DataFrame([r + [None] * (len(header) - len(r)) for r in body], columns=header)
+
+    def update(self, worksheet, data):
+        self._request('write')
+        rows = [list(data.columns)] + data.astype(object).where(data.notna(), None).values.tolist()
+        with self._connect() as db:
+            db.execute("DELETE FROM cells WHERE worksheet = ?", (worksheet,))
+            db.executemany(
+                "INSERT INTO cells (worksheet, row, cells) VALUES (?, ?, ?)",
+                ((worksheet, i, json.dumps(r, default=_json_default)) for i, r in enumerate(rows, start=1))
+            )
+
+    def row_count(self, worksheet):
+        """Data rows in the worksheet, without counting as an API request."""
+        with self._connect() as db:
+            return db.execute(
+                "SELECT COUNT(*) FROM cells WHERE worksheet = ? AND row > 1", (worksheet,)
+            ).fetchone()[0]
@@ -1,10 +1,21 @@
 import streamlit as st
 import time
+import uuid
 from experiment import Experiment
 from ui import display_boxes, show_instructions, show_feedback
-from data import save_round_data, save_questionnaire, get_unique_filename
+from timeline import earnings_timeline
+from data import save_round_data, save_questionnaire, get_unique_filename, session_store
+from writer import get_writer
 from questionnaires import post_phase_questionnaire, debrief_questionnaire
 from constants import PHASES, ROUNDS_PER_PHASE
+from warmup import start_warmup
+from metrics import start_exporter, timer
+from profiling import profile_rerun
+
+# pandas, plotly and the gsheets connector load in the background while the first screens render
+start_warmup()
+# Prometheus metrics on METRICS_PORT / METRICS_FILE, when configured
+start_exporter()
 
 # Session state initialization
 def init_session():
@@ -31,19 +42,77 @@ def init_session():
     st.session_state['box_chosen'] = None
     st.session_state['last_round_message'] = ""
     st.session_state['last_message_type'] = 'info'
-    st.session_state['earnings_history'] = []
-    st.session_state['round_history'] = []
+    st.session_state['timeline_state'] = None
     st.session_state['start_clicked'] = False
     st.session_state['begin_rounds_clicked'] = False
     st.session_state['submit_questionnaire_clicked'] = False
     st.session_state['submit_debrief_clicked'] = False
     st.session_state['restart_clicked'] = False
     st.session_state['final_submission_complete'] = False
-    # Unique session id for deduplication and tracing
-    st.session_state['session_id'] = str(int(time.time()))
+    # Unique session id for deduplication and tracing; random, so simultaneous starts never collide
+    st.session_state['session_id'] = uuid.uuid4().hex
+
+def restore_session(session_id=None, participant_id=None, professional_area=None):
+    """
+    Resume an unfinished session from the local session store, at the phase and round
+    where it stopped. A professional_area that differs from the stored one replaces it
+    for the whole session. Returns True if a session was found.
+    """
+    saved = session_store().load_open(session_id=session_id, participant_id=participant_id)
+    if saved is None:
+        return False
+    if professional_area and professional_area != saved['professional_area']:
+        # Rows are only written at the debrief, so the whole session is logged under the new area
+        session_store().set_professional_area(saved['session_id'], professional_area)
+        st.info(
+            f"Resuming your unfinished session. Your professional area was changed from "
+            f"{saved['professional_area']} to {professional_area}."
+        )
+        saved['professional_area'] = professional_area
+        for entry in saved['questionnaires']:
+            entry['professional_area'] = professional_area
+    exp = Experiment(
+        saved['participant_id'],
+        phase_order=saved['phase_order'],
+        rng_mode=saved['rng_mode'],
+        session_id=saved['session_id'],
+        professional_area=saved['professional_area']
+    )
+    # The stored order was drawn by randomize_phases when the session started
+    exp.seeds['phase_order'] = saved['participant_id']
+    questionnaires = saved['questionnaires']
+    phase_idx = len([q for q in questionnaires if q.get('phase') != 'debrief'])
+    if phase_idx >= len(PHASES):
+        exp.restore(saved['rounds'], exp.phase_order[-1])
+        step = 'debrief'
+        st.session_state['all_done'] = True
+    else:
+        played = exp.restore(saved['rounds'], exp.phase_order[phase_idx])
+        if played == 0:
+            step = 'instructions'
+        elif played < ROUNDS_PER_PHASE:
+            step = 'rounds'
+            st.session_state['start_time'] = time.time()
+        else:
+            step = 'questionnaire'
+            st.session_state['phase_complete'] = True
+    st.session_state['session_id'] = saved['session_id']
+    st.session_state['participant_id'] = saved['participant_id']
+    st.session_state['professional_area'] = saved['professional_area']
+    st.session_state['phase_order'] = exp.phase_order
+    st.session_state['experiment'] = exp
+    st.session_state['phase_idx'] = min(phase_idx, len(PHASES) - 1)
+    st.session_state['all_questionnaire_data'] = questionnaires
+    st.session_state['timeline_state'] = None
+    st.session_state['step'] = step
+    st.query_params['session'] = saved['session_id']
+    return True
 
 if 'step' not in st.session_state:
     init_session()
+    # A reload or reconnect starts a new Streamlit session; continue the one in the URL
+    if st.query_params.get('session'):
+        restore_session(session_id=st.query_params['session'])
 
 # --- Callback functions ---
 def start_experiment():
@@ -67,11 +136,23 @@ def set_participant_id():
     st.session_state['participant_id'] = int(participant_id)
     st.session_state['professional_area'] = professional_area
     
+    # Same participant back without the session link: continue their unfinished session
+    if restore_session(participant_id=st.session_state['participant_id'], professional_area=professional_area):
+        return
+
     # Initialize experiment
-    exp = Experiment(st.session_state['participant_id'])
+    exp = Experiment(
+        st.session_state['participant_id'],
+        session_id=st.session_state['session_id'],
+        professional_area=professional_area
+    )
     st.session_state['phase_order'] = exp.phase_order
     st.session_state['experiment'] = exp
     st.session_state['step'] = 'instructions'
+    session_store().start(
+        st.session_state['session_id'], exp.participant_id, professional_area, exp.phase_order, exp.rng_mode
+    )
+    st.query_params['session'] = st.session_state['session_id']
 
 
 def begin_rounds():
@@ -88,9 +169,8 @@ def begin_rounds():
     # Clear the message when starting a new phase
     st.session_state['last_round_message'] = ""
     st.session_state['last_message_type'] = 'info'
-    # Reset earnings history for new phase
-    st.session_state['earnings_history'] = []
-    st.session_state['round_history'] = []
+    # Start a new earnings timeline for the new phase
+    st.session_state['timeline_state'] = None
     st.session_state['begin_rounds_clicked'] = False
 
 def choose_box_a():
@@ -114,6 +194,7 @@ def submit_questionnaire():
         **responses
     }
     st.session_state['all_questionnaire_data'].append(questionnaire_entry)
+    session_store().log_questionnaire(st.session_state['session_id'], questionnaire_entry)
     st.session_state['phase_complete'] = False
     if st.session_state['phase_idx'] < 2:
         st.session_state['phase_idx'] += 1
@@ -136,22 +217,23 @@ def submit_debrief_callback():
         **feedback
     }
     st.session_state['all_questionnaire_data'].append(debrief_entry)
+    session_store().log_questionnaire(st.session_state['session_id'], debrief_entry)
 
-    from data import save_questionnaire, save_round_data
-
-    # Save questionnaires
-    save_questionnaire(
+    # Hand both batches to the background writer so the page re-renders immediately
+    writer = get_writer()
+    writer.submit_questionnaire(
         st.session_state['participant_id'], 'batch', st.session_state['all_questionnaire_data']
     )
-    # Save experiment data
     exp = st.session_state.get('experiment')
     if exp and exp.data:
-        save_round_data(
+        writer.submit_rounds(
             exp.data,
             st.session_state['participant_id'],
             initial_probs=exp.get_initial_probs(),
             seeds=exp.get_seeds()
         )
+    # Completed only once the writer has logged both batches, so a crash before that can still resume
+    writer.submit_completion(st.session_state['session_id'])
     st.session_state['step'] = 'thank_you'
 
 def restart_experiment():
@@ -243,42 +325,10 @@ def rounds_screen():
         st.button('Box B', key=f"B_{display_phase_num}_{exp.round}", on_click=choose_box_b)
     
     # Display earnings timeline graph at the bottom - only when not transitioning to questionnaire
-    if st.session_state['earnings_history'] and not st.session_state.get('phase_complete', False):
+    rounds, earnings = exp.log.phase_history(actual_phase)
+    if len(rounds) and not st.session_state.get('phase_complete', False):
         st.subheader("Cumulative Earnings Timeline")
-        import plotly.express as px
-        import pandas as pd
-        
-        # Create a DataFrame for the timeline
-        timeline_df = pd.DataFrame({
-            'Round': st.session_state['round_history'],
-            'Cumulative Earnings (€)': st.session_state['earnings_history']
-        })
-        
-        # Create the line chart
-        fig = px.line(timeline_df, 
-                     x='Round', 
-                     y='Cumulative Earnings (€)',
-                     title=f"Phase {display_phase_num} - Earnings Progress",
-                     markers=True)
-        
-        # Customize the chart
-        fig.update_layout(
-            height=400,  # Increased height
-            showlegend=False,
-            xaxis_title="Round",
-            yaxis_title="Cumulative Earnings (€)"
-        )
-        
-        # Add horizontal line at y=0
-        fig.add_hline(y=0, line_dash="dash", line_color="gray", opacity=0.7)
-        
-        # Remove toolbar icons and display options
-        config = {
-            'displayModeBar': False,  # This removes all the toolbar icons
-            'staticPlot': False  # Keep it interactive for hover, but no toolbar
-        }
-        
-        st.plotly_chart(fig, use_container_width=True, config=config)
+        earnings_timeline(display_phase_num, rounds, earnings)
     
     # Handle box choice
     if st.session_state.get('box_chosen'):
@@ -286,12 +336,9 @@ def rounds_screen():
         decision_time = time.time() - st.session_state['start_time']
         result, reward, special = exp.draw_ball(box_chosen)
         exp.cumulative_earnings += reward
-        exp.data.append([
-            st.session_state['session_id'],
-            st.session_state['participant_id'], st.session_state['professional_area'], 
-            actual_phase, exp.round, box_chosen, round(decision_time, 3), result, reward, 
-            exp.cumulative_earnings, round(exp.p_safe, 3), round(exp.p_uncertain, 3)
-        ])
+        exp.log_round(box_chosen, decision_time, result, reward)
+        # Persist the round right away so a dropped connection can resume from here
+        session_store().log_round(exp.log.session_id, exp.log.records()[-1])
         exp.adjust_probabilities(box_chosen)
         
         # Update the persistent message for this round with appropriate color
@@ -308,10 +355,6 @@ def rounds_screen():
             st.session_state['last_round_message'] = f"💿 Oh no! You drew a silver ball from Box {box_chosen} ({reward} €)"
             st.session_state['last_message_type'] = 'error'  # Red for negative surprise
         
-        # Update earnings history for the timeline graph
-        st.session_state['earnings_history'].append(exp.cumulative_earnings)
-        st.session_state['round_history'].append(exp.round)
-        
         st.session_state['start_time'] = time.time()
         st.session_state['box_chosen'] = None
         
@@ -363,20 +406,22 @@ def thank_you_screen():
         init_session()
         st.session_state['restart_clicked'] = False
 
-# Main app flow
-if st.session_state['step'] == 'welcome':
-    welcome_screen()
-elif st.session_state['step'] == 'enter_id':
-    id_screen()
-elif st.session_state['step'] == 'instructions':
-    instructions_screen()
-elif st.session_state['step'] == 'rounds':
-    rounds_screen()
-elif st.session_state['step'] == 'questionnaire':
-    questionnaire_screen()
-elif st.session_state['step'] == 'debrief':
-    debrief_screen()
-elif st.session_state['step'] == 'exit_screen':
-    exit_screen()
-elif st.session_state['step'] == 'thank_you':
-    thank_you_screen()
+# Main app flow, timed per step; the timer also records runs cut short by st.rerun().
+# With PROFILE_RERUNS set, (a sample of) runs are also profiled per step.
+with timer('experiment_rerun_seconds', step=st.session_state['step']), profile_rerun(st.session_state['step']):
+    if st.session_state['step'] == 'welcome':
+        welcome_screen()
+    elif st.session_state['step'] == 'enter_id':
+        id_screen()
+    elif st.session_state['step'] == 'instructions':
+        instructions_screen()
+    elif st.session_state['step'] == 'rounds':
+        rounds_screen()
+    elif st.session_state['step'] == 'questionnaire':
+        questionnaire_screen()
+    elif st.session_state['step'] == 'debrief':
+        debrief_screen()
+    elif st.session_state['step'] == 'exit_screen':
+        exit_screen()
+    elif st.session_state['step'] == 'thank_you':
+        thank_you_screen()
@@ -0,0 +1,185 @@
+"""
+In-process latency histograms and counters, exported in Prometheus text format.
+
+Set METRICS_PORT (and METRICS_HOST) to serve them on http://<host>:<port>/metrics,
+and/or METRICS_FILE to rewrite a file every METRICS_FILE_INTERVAL seconds (e.g. for
+node_exporter's textfile collector). Recording is cheap and always on; exporting is off unless
+configured.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+METRICS_PORT = os.environ.get('METRICS_PORT')
+METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')  # 0.0.0.0 to allow remote scrapes
+METRICS_FILE = os.environ.get('METRICS_FILE')
+METRICS_FILE_INTERVAL = 15.0
+# Upper bounds in seconds; covers a sub-millisecond draw up to a slow Sheets call
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRIC_HELP = {
+    'experiment_rerun_seconds': 'Script run time of main.py by step',
+    'experiment_draw_ball_seconds': 'Experiment.draw_ball',
+    'experiment_display_boxes_seconds': 'ui.display_boxes',
+    'experiment_chart_build_seconds': 'Building the earnings timeline figure',
+    'experiment_save_round_data_seconds': 'Writing one batch of round rows (WAL, CSV, Parquet, Sheets)',
+    'experiment_save_questionnaire_seconds': 'Writing one batch of questionnaire rows (WAL, CSV, Parquet, Sheets)',
+    'experiment_sheet_append_seconds': 'append_dataframe_to_sheet',
+    'experiment_sheet_read_seconds': 'Sheets reads made while appending',
+    'experiment_sheet_update_seconds': 'Sheets writes made while appending',
+    'experiment_sheet_errors_total': 'Failed Sheets appends',
+    'experiment_wal_retries_total': 'Write-ahead log pushes retried after a failure',
+    'experiment_write_errors_total': 'Failed write-behind flushes',
+}
+
+_lock = threading.Lock()
+_histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+_counters = {}  # (name, labels) -> value
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def observe(name, seconds, **labels):
+    key = _key(name, labels)
+    index = bisect_left(LATENCY_BUCKETS, seconds)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0, 0]
+        hist[index] += 1
+        hist[-2] += seconds
+        hist[-1] += 1
+
+
+def inc(name, amount=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+@contextmanager
+def timer(name, **labels):
+    """Observe the duration of the block, including when it raises."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def timed(name, **labels):
+    """Decorator form of timer()."""
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+# --- Export ---
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+
+def _header(lines, name, kind, seen):
+    if name not in seen:
+        seen.add(name)
+        if name in METRIC_HELP:
+            lines.append(f'# HELP {name} {METRIC_HELP[name]}')
+        lines.append(f'# TYPE {name} {kind}')
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        histograms = {k: list(v) for k, v in _histograms.items()}
+        counters = dict(_counters)
+    lines = []
+    seen = set()
+    for (name, labels), hist in sorted(histograms.items()):
+        _header(lines, name, 'histogram', seen)
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), hist):
+            cumulative += count
+            lines.append(f'{name}_bucket{_labels(labels, [("le", bound)])} {cumulative}')
+        lines.append(f'{name}_sum{_labels(labels)} {hist[-2]}')
+        lines.append(f'{name}_count{_labels(labels)} {hist[-1]}')
+    for (name, labels), value in sorted(counters.items()):
+        _header(lines, name, 'counter', seen)
+        lines.append(f'{name}{_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_file(path=METRICS_FILE):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(render())
+    os.replace(tmp, path)
+
+
+def _serve(port, host=METRICS_HOST):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, int(port)), Handler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
+
+
+def _write_periodically(path, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            write_file(path)
+        except OSError as e:
+            print(f"Could not write metrics to {path}: {e}")
+
+
+_exporter_started = False
+_exporter_lock = threading.Lock()
+
+def start_exporter(port=METRICS_PORT, path=METRICS_FILE, interval=METRICS_FILE_INTERVAL):
+    """Start the configured exporters once per process."""
+    global _exporter_started
+    with _exporter_lock:
+        if _exporter_started:
+            return
+        _exporter_started = True
+    if port:
+        try:
+            _serve(port)
+        except OSError as e:
+            print(f"Could not serve metrics on port {port}: {e}")
+    if path:
+        threading.Thread(
+            target=_write_periodically, args=(path, interval), name='metrics-file', daemon=True
+        ).start()
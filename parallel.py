@@ -0,0 +1,23 @@
+"""
+Chunked process-pool map shared by the offline tools (harness, fitting, audit).
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+CHUNKS_PER_WORKER = 4  # Enough chunks to even out uneven task costs
+
+
+def run_chunked(func, tasks, max_workers=None, chunk_size=None):
+    """
+    Call func on consecutive chunks of tasks across a process pool and return its
+    results in chunk order. Tasks are sent in chunks so per-task IPC overhead does
+    not limit scaling; with one worker or one chunk everything runs in-process.
+    """
+    workers = max_workers or os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = max(1, len(tasks) // (workers * CHUNKS_PER_WORKER))
+    chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+    if workers == 1 or len(chunks) <= 1:
+        return [func(chunk) for chunk in chunks]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(func, chunks))
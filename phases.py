@@ -0,0 +1,108 @@
+"""
+Declarative phase specification, compiled once into NumPy lookup tables.
+
+Each phase lists per box: the range its initial probability is drawn from (equal
+bounds mean a fixed value and no draw), the red/black rewards, the chance of a
+special gold/silver ball with its rewards, and how the box is displayed. The
+Experiment, the UI and the batch simulation all index the compiled tables by
+phase and box instead of branching on the phase number, so a new phase variant
+is a new entry in PHASE_SPECS.
+"""
+import numpy as np
+
+from constants import *
+
+# How a box is shown: ball grid with the known probability, or question marks
+DISPLAY_MODES = ['known', 'ambiguity', 'rumsfeld']
+DISPLAY_LABELS = {
+    'known': 'Known probability (risk)',
+    'ambiguity': 'Unknown probability (ambiguity)',
+    'rumsfeld': 'Totally different rules might apply',
+}
+
+
+def _box(init, win, loss, display, special_prob=0.0, special_rewards=(REWARD_GOLD, REWARD_SILVER)):
+    return {
+        'init': init, 'rewards': (win, loss), 'display': display,
+        'special_prob': special_prob, 'special_rewards': special_rewards,
+    }
+
+
+# Initial probabilities are drawn in box order (A, then B) from the phase's seed
+PHASE_SPECS = {
+    1: {
+        'A': _box((SAFE_PROB_INIT, SAFE_PROB_INIT), REWARD_RED, REWARD_BLACK, 'known'),
+        'B': _box((UNCERTAIN_PROB_MIN, UNCERTAIN_PROB_MAX), AMBIGUITY_REWARD, AMBIGUITY_LOSS, 'ambiguity'),
+    },
+    2: {
+        'A': _box((SAFE_PROB_INIT, SAFE_PROB_INIT), REWARD_RED, REWARD_BLACK, 'known'),
+        'B': _box((PROB_LIMIT_MIN, PROB_LIMIT_MAX), REWARD_RED, REWARD_BLACK, 'rumsfeld',
+                  special_prob=RUMSFELD_SPECIAL_PROB_PHASE2),
+    },
+    3: {
+        'A': _box((UNCERTAIN_PROB_MIN, UNCERTAIN_PROB_MAX), AMBIGUITY_REWARD, AMBIGUITY_LOSS, 'ambiguity'),
+        'B': _box((PROB_LIMIT_MIN, PROB_LIMIT_MAX), REWARD_RED, REWARD_BLACK, 'rumsfeld',
+                  special_prob=RUMSFELD_SPECIAL_PROB_PHASE3),
+    },
+}
+
+BOX_INDEX = {box: i for i, box in enumerate(BOX_CODES)}
+RESULT_INDEX = {result: i for i, result in enumerate(RESULT_CODES)}
+
+
+def compile_specs(specs):
+    """
+    Lookup tables indexed [phase, box] (row 0 unused, so phase numbers index directly):
+    INIT_LOW/INIT_HIGH/INIT_DRAWN, SPECIAL_PROB, DISPLAY (index into DISPLAY_MODES)
+    and REWARDS[phase, box, result] with result in RESULT_CODES order.
+    """
+    size = (max(specs) + 1, len(BOX_CODES))
+    tables = {
+        'INIT_LOW': np.zeros(size),
+        'INIT_HIGH': np.zeros(size),
+        'SPECIAL_PROB': np.zeros(size),
+        'DISPLAY': np.zeros(size, dtype=np.int8),
+        'REWARDS': np.zeros(size + (len(RESULT_CODES),), dtype=np.int16),
+    }
+    for phase, spec in specs.items():
+        for box, b in BOX_INDEX.items():
+            box_spec = spec[box]
+            tables['INIT_LOW'][phase, b], tables['INIT_HIGH'][phase, b] = box_spec['init']
+            tables['SPECIAL_PROB'][phase, b] = box_spec['special_prob']
+            tables['DISPLAY'][phase, b] = DISPLAY_MODES.index(box_spec['display'])
+            (win, loss), (gold, silver) = box_spec['rewards'], box_spec['special_rewards']
+            outcome = {'red': win, 'black': loss, 'gold': gold, 'silver': silver}
+            tables['REWARDS'][phase, b] = [outcome[result] for result in RESULT_CODES]
+    tables['INIT_DRAWN'] = tables['INIT_LOW'] != tables['INIT_HIGH']
+    for table in tables.values():
+        table.flags.writeable = False
+    return tables
+
+
+_TABLES = compile_specs(PHASE_SPECS)
+INIT_LOW = _TABLES['INIT_LOW']
+INIT_HIGH = _TABLES['INIT_HIGH']
+INIT_DRAWN = _TABLES['INIT_DRAWN']
+SPECIAL_PROB = _TABLES['SPECIAL_PROB']
+DISPLAY = _TABLES['DISPLAY']
+REWARDS = _TABLES['REWARDS']
+
+
+def initial_probs(phase, rng, n=None):
+    """
+    Initial (p_safe, p_uncertain) for a phase. Only the drawn boxes consume rng, in
+    box order, with one uniform each (or n each when n is given).
+    """
+    values = []
+    for b in range(len(BOX_CODES)):
+        if INIT_DRAWN[phase, b]:
+            values.append(rng.uniform(INIT_LOW[phase, b], INIT_HIGH[phase, b], n))
+        elif n is None:
+            values.append(INIT_LOW[phase, b])
+        else:
+            values.append(np.full(n, INIT_LOW[phase, b]))
+    return tuple(values)
+
+
+def display_mode(phase, box):
+    return DISPLAY_MODES[DISPLAY[phase, BOX_INDEX[box]]]
@@ -0,0 +1,100 @@
+"""
+Opt-in cProfile of main.py script runs, merged per step across sessions.
+
+    PROFILE_RERUNS=1 streamlit run main.py          # profile every rerun
+    PROFILE_RERUNS=0.1 streamlit run main.py        # profile a random 10% of reruns
+
+Every PROFILE_REPORT_INTERVAL seconds (and at exit) each step gets
+<PROFILE_DIR>/<step>.pstats, loadable with pstats or snakeviz, and <step>.txt with
+the top PROFILE_TOP_N functions by cumulative time. When PROFILE_RERUNS is unset,
+profile_rerun() is a shared no-op context manager.
+"""
+import atexit
+import io
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+PROFILE_RERUNS = float(os.environ.get('PROFILE_RERUNS') or 0)  # Fraction of reruns to profile
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_REPORT_INTERVAL = float(os.environ.get('PROFILE_REPORT_INTERVAL', 60))
+PROFILE_TOP_N = int(os.environ.get('PROFILE_TOP_N', 30))
+
+_NOT_PROFILED = nullcontext()
+_lock = threading.Lock()
+_stats = {}  # step -> merged pstats.Stats
+_counts = {}  # step -> profiled reruns
+_reporter = None
+
+
+def profile_rerun(step):
+    """Context manager wrapping one script run; profiles it if the sample says so."""
+    if not PROFILE_RERUNS or (PROFILE_RERUNS < 1 and random.random() >= PROFILE_RERUNS):
+        return _NOT_PROFILED
+    return _profiled(step)
+
+
+@contextmanager
+def _profiled(step):
+    import cProfile
+    _start_reporter()
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another rerun holds the interpreter-wide profiler (Python 3.12+); skip this one
+        yield
+        return
+    try:
+        yield
+    finally:
+        profiler.disable()
+        _merge(step, profiler)
+
+
+def _merge(step, profiler):
+    import pstats
+    with _lock:
+        if step in _stats:
+            _stats[step].add(profiler)
+        else:
+            _stats[step] = pstats.Stats(profiler)
+        _counts[step] = _counts.get(step, 0) + 1
+
+
+def write_reports(directory=PROFILE_DIR, top_n=PROFILE_TOP_N):
+    """Write the merged .pstats file and a top-N text report for every profiled step."""
+    import pstats
+    os.makedirs(directory, exist_ok=True)
+    with _lock:
+        for step, stats in _stats.items():
+            path = os.path.join(directory, f'{step}.pstats')
+            stats.dump_stats(path)
+            out = io.StringIO()
+            out.write(f"{_counts[step]} profiled reruns of step '{step}'\n")
+            pstats.Stats(path, stream=out).sort_stats('cumulative').print_stats(top_n)
+            with open(os.path.join(directory, f'{step}.txt'), 'w') as f:
+                f.write(out.getvalue())
+
+
+def _report_periodically(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            write_reports()
+        except OSError as e:
+            print(f"Could not write profiling reports: {e}")
+
+
+def _start_reporter():
+    global _reporter
+    with _lock:
+        if _reporter is not None:
+            return
+        _reporter = threading.Thread(
+            target=_report_periodically, args=(PROFILE_REPORT_INTERVAL,), name='profile-reports', daemon=True
+        )
+        _reporter.start()
+    atexit.register(write_reports)
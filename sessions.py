@@ -0,0 +1,149 @@
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from constants import BOX_CODES, RESULT_CODES
+
+SESSION_FILE = 'experiment_sessions.sqlite3'
+
+
+class SessionStore:
+    """
+    Local record of sessions in progress. Every round and questionnaire is written as
+    it happens, so a session whose websocket dropped, or whose server restarted, can
+    be picked up again at the same phase and round. Write errors are printed and
+    never interrupt the experiment.
+    """
+
+    def __init__(self, path=SESSION_FILE):
+        self.path = path
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, participant_id INTEGER NOT NULL, "
+                "professional_area TEXT NOT NULL, phase_order TEXT NOT NULL, rng_mode TEXT NOT NULL, "
+                "created REAL NOT NULL, updated REAL NOT NULL, completed INTEGER NOT NULL DEFAULT 0)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS rounds ("
+                "session_id TEXT NOT NULL, phase INTEGER NOT NULL, round INTEGER NOT NULL, "
+                "box_chosen TEXT NOT NULL, decision_time REAL NOT NULL, result TEXT NOT NULL, "
+                "reward INTEGER NOT NULL, cumulative_earnings INTEGER NOT NULL, "
+                "p_safe REAL NOT NULL, p_uncertain REAL NOT NULL, "
+                "PRIMARY KEY (session_id, phase, round))"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS questionnaires ("
+                "session_id TEXT NOT NULL, phase TEXT NOT NULL, payload TEXT NOT NULL, "
+                "PRIMARY KEY (session_id, phase))"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS sessions_participant ON sessions (participant_id, completed)")
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _write(self, what, statements):
+        try:
+            with self._connect() as db:
+                # One round per transaction; NORMAL is durable across app crashes in WAL mode
+                db.execute("PRAGMA synchronous=NORMAL")
+                for sql, args in statements:
+                    db.execute(sql, args)
+            return True
+        except sqlite3.Error as e:
+            print(f"Session store error saving {what}: {e}")
+            return False
+
+    # --- Writes ---
+    def start(self, session_id, participant_id, professional_area, phase_order, rng_mode):
+        now = time.time()
+        return self._write('session', [(
+            "INSERT OR IGNORE INTO sessions (session_id, participant_id, professional_area, "
+            "phase_order, rng_mode, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (session_id, participant_id, professional_area, json.dumps(phase_order), rng_mode, now, now)
+        )])
+
+    def log_round(self, session_id, record):
+        """Store one RoundLog record. Replaying the same round is a no-op."""
+        row = (
+            session_id, int(record['phase']), int(record['round']), BOX_CODES[record['box']],
+            float(record['decision_time']), RESULT_CODES[record['result']], int(record['reward']),
+            int(record['cumulative_earnings']), float(record['p_safe']), float(record['p_uncertain'])
+        )
+        return self._write('round', [
+            ("INSERT OR IGNORE INTO rounds VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row),
+            ("UPDATE sessions SET updated = ? WHERE session_id = ?", (time.time(), session_id)),
+        ])
+
+    def log_questionnaire(self, session_id, entry):
+        payload = json.dumps(entry, default=str)
+        return self._write('questionnaire', [
+            ("INSERT OR IGNORE INTO questionnaires VALUES (?, ?, ?)", (session_id, str(entry.get('phase', '')), payload)),
+            ("UPDATE sessions SET updated = ? WHERE session_id = ?", (time.time(), session_id)),
+        ])
+
+    def set_professional_area(self, session_id, professional_area):
+        """Change the area of a session and of the questionnaires it already logged."""
+        return self._write('professional area', [
+            ("UPDATE sessions SET professional_area = ?, updated = ? WHERE session_id = ?",
+             (professional_area, time.time(), session_id)),
+            ("UPDATE questionnaires SET payload = json_set(payload, '$.professional_area', ?) WHERE session_id = ?",
+             (professional_area, session_id)),
+        ])
+
+    def complete(self, session_id):
+        return self._write('completion', [
+            ("UPDATE sessions SET completed = 1, updated = ? WHERE session_id = ?", (time.time(), session_id)),
+        ])
+
+    # --- Resume ---
+    def load_open(self, session_id=None, participant_id=None):
+        """
+        Return the unfinished session with this id, or the participant's most recent
+        unfinished one, as a dict with its rounds (in play order) and questionnaires.
+        Returns None if there is nothing to resume.
+        """
+        if session_id is None and participant_id is None:
+            return None
+        try:
+            with self._connect() as db:
+                if session_id is not None:
+                    meta = db.execute(
+                        "SELECT session_id, participant_id, professional_area, phase_order, rng_mode "
+                        "FROM sessions WHERE session_id = ? AND completed = 0", (session_id,)
+                    ).fetchone()
+                else:
+                    meta = db.execute(
+                        "SELECT session_id, participant_id, professional_area, phase_order, rng_mode "
+                        "FROM sessions WHERE participant_id = ? AND completed = 0 "
+                        "ORDER BY updated DESC LIMIT 1", (participant_id,)
+                    ).fetchone()
+                if meta is None:
+                    return None
+                rounds = db.execute(
+                    "SELECT phase, round, box_chosen, decision_time, result, reward, cumulative_earnings, "
+                    "p_safe, p_uncertain FROM rounds WHERE session_id = ? ORDER BY rowid", (meta[0],)
+                ).fetchall()
+                questionnaires = db.execute(
+                    "SELECT payload FROM questionnaires WHERE session_id = ? ORDER BY rowid", (meta[0],)
+                ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Session store error loading session: {e}")
+            return None
+        return {
+            'session_id': meta[0],
+            'participant_id': meta[1],
+            'professional_area': meta[2],
+            'phase_order': json.loads(meta[3]),
+            'rng_mode': meta[4],
+            'rounds': rounds,
+            'questionnaires': [json.loads(p) for (p,) in questionnaires],
+        }
@@ -0,0 +1,140 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from constants import *
+from phases import REWARDS, SPECIAL_PROB, initial_probs
+
+BOXES = np.array(BOX_CODES)
+RESULTS = np.array(RESULT_CODES)
+RED, BLACK, GOLD, SILVER = range(4)
+SIMULATED_AREA = 'Simulated'
+SIMULATION_BATCH_SIZE = 50_000
+
+
+def _choose_a(policy, phase, rnd, p_safe, p_uncertain, rng):
+    """
+    policy is either the probability of choosing Box A (scalar or one value per
+    participant) or a callable policy(phase, round, p_safe, p_uncertain, rng)
+    returning a boolean array that is True where Box A is chosen.
+    """
+    if callable(policy):
+        return np.asarray(policy(phase, rnd, p_safe, p_uncertain, rng), dtype=bool)
+    return rng.random(p_safe.shape[0]) < np.asarray(policy)
+
+
+def simulate_phase(phase, n, policy=0.5, rng=None, rounds=ROUNDS_PER_PHASE):
+    """
+    Run one phase for n participants at once. Uses the same three uniforms per round
+    as Experiment.draw_ball in generator mode: special decision, special colour and
+    red/black. Returns a dict of (rounds, n) arrays plus the initial probabilities.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    # Same tables and draw order as Experiment.reset_for_phase and Experiment.draw_ball
+    p_safe, p_uncertain = initial_probs(phase, rng, n)
+    init_p_safe, init_p_uncertain = p_safe.copy(), p_uncertain.copy()
+    rewards = REWARDS[phase]
+    special_prob = SPECIAL_PROB[phase]
+
+    out = {
+        'box_b': np.empty((rounds, n), dtype=bool),
+        'result': np.empty((rounds, n), dtype=np.int8),
+        'reward': np.empty((rounds, n), dtype=np.int16),
+        'cumulative_earnings': np.empty((rounds, n), dtype=np.int32),
+        'p_safe': np.empty((rounds, n)),
+        'p_uncertain': np.empty((rounds, n)),
+    }
+    earnings = np.zeros(n, dtype=np.int32)
+    for r in range(rounds):
+        choose_a = _choose_a(policy, phase, r + 1, p_safe, p_uncertain, rng)
+        u = rng.random((3, n))
+        box = (~choose_a).astype(np.intp)
+        red = u[2] < np.where(choose_a, p_safe, p_uncertain)
+        special = u[0] < special_prob[box]
+        gold = u[1] < 0.5
+        result = np.where(special, np.where(gold, GOLD, SILVER), np.where(red, RED, BLACK))
+        reward = rewards[box, result]
+        earnings += reward
+        out['box_b'][r] = ~choose_a
+        out['result'][r] = result
+        out['reward'][r] = reward
+        out['cumulative_earnings'][r] = earnings
+        # Logged probabilities are the ones in force for the draw, before adjustment
+        out['p_safe'][r] = p_safe
+        out['p_uncertain'][r] = p_uncertain
+        # Mirrors Experiment.adjust_probabilities
+        p_safe = np.where(choose_a, np.maximum(PROB_LIMIT_MIN, p_safe - PROB_ADJUST),
+                          np.minimum(PROB_LIMIT_MAX, p_safe + PROB_ADJUST))
+        p_uncertain = np.where(choose_a, np.minimum(PROB_LIMIT_MAX, p_uncertain + PROB_ADJUST),
+                               np.maximum(PROB_LIMIT_MIN, p_uncertain - PROB_ADJUST))
+    out['init_p_safe'] = init_p_safe
+    out['init_p_uncertain'] = init_p_uncertain
+    return out
+
+
+def simulate(n_participants, policy=0.5, seed=None, phase_orders=None,
+             rounds=ROUNDS_PER_PHASE, first_participant_id=1):
+    """
+    Simulate n_participants full sessions (3 phases x rounds) as array operations.
+    Returns a dict of flat columns in the experiment_data_all.csv schema, ordered by
+    participant, then phase in that participant's order, then round.
+    """
+    rng = np.random.default_rng(seed)
+    n = n_participants
+    if phase_orders is None:
+        phase_orders = rng.permuted(np.tile(PHASES, (n, 1)), axis=1)
+    phase_orders = np.asarray(phase_orders)
+    if phase_orders.ndim == 1:
+        phase_orders = np.tile(phase_orders, (n, 1))
+
+    by_phase = {phase: simulate_phase(phase, n, policy, rng, rounds) for phase in PHASES}
+    rows = np.arange(n)
+
+    def arrange(key):
+        # Stack per phase as (phase, participant, ...), then pick each participant's phases in order
+        stacked = np.stack([by_phase[phase][key].T for phase in PHASES])
+        return stacked[phase_orders - 1, rows[:, None]].reshape(-1)
+
+    participant_ids = np.repeat(np.arange(first_participant_id, first_participant_id + n), 3 * rounds)
+    return {
+        'session_id': participant_ids,
+        'participant_id': participant_ids,
+        'professional_area': pd.Categorical.from_codes(
+            np.zeros(n * 3 * rounds, dtype=np.int8), [SIMULATED_AREA]),
+        'phase': np.repeat(phase_orders.reshape(-1), rounds).astype(np.int8),
+        'round': np.tile(np.arange(1, rounds + 1, dtype=np.int16), 3 * n),
+        'box_chosen': pd.Categorical.from_codes(arrange('box_b').astype(np.int8), BOXES),
+        'decision_time': np.full(n * 3 * rounds, np.nan),
+        'result': pd.Categorical.from_codes(arrange('result'), RESULTS),
+        'reward': arrange('reward'),
+        'cumulative_earnings': arrange('cumulative_earnings'),
+        'p_safe': np.round(arrange('p_safe'), 3),
+        'p_uncertain': np.round(arrange('p_uncertain'), 3),
+        'init_p_safe': np.repeat(arrange('init_p_safe'), rounds),
+        'init_p_uncertain': np.repeat(arrange('init_p_uncertain'), rounds),
+    }
+
+
+def to_frame(columns):
+    return pd.DataFrame(columns, columns=RESULTS_HEADER)
+
+
+def simulate_batches(n_participants, policy=0.5, seed=None, batch_size=SIMULATION_BATCH_SIZE,
+                     rounds=ROUNDS_PER_PHASE):
+    """Yield simulate() column dicts in batches so large runs stay within memory."""
+    seeds = np.random.SeedSequence(seed)
+    for start in range(0, n_participants, batch_size):
+        size = min(batch_size, n_participants - start)
+        yield simulate(size, policy, seed=seeds.spawn(1)[0], rounds=rounds,
+                       first_participant_id=start + 1)
+
+
+if __name__ == '__main__':
+    n = 1_000_000
+    started = time.perf_counter()
+    total = 0
+    for columns in simulate_batches(n, seed=0):
+        total += int(columns['reward'].sum(dtype=np.int64))
+    elapsed = time.perf_counter() - started
+    print(f"Simulated {n} sessions in {elapsed:.1f}s (mean earnings {total / n:.2f} €)")
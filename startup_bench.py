@@ -0,0 +1,77 @@
+"""
+Cold-start benchmark for the app.
+
+Reports, each in a fresh interpreter, the cumulative import time of the app modules
+and heavy dependencies, and the time for the first script run of main.py to
+render welcome_screen.
+
+    python startup_bench.py --repeat 5
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_MODULES = ['constants', 'experiment', 'ui', 'questionnaires', 'wal', 'data', 'writer', 'warmup']
+HEAVY_MODULES = ['numpy', 'pandas', 'plotly.express', 'streamlit_gsheets']
+
+FIRST_RENDER_SCRIPT = """
+import time
+from streamlit.testing.v1 import AppTest
+started = time.perf_counter()
+at = AppTest.from_file({path!r}, default_timeout=60).run()
+elapsed = time.perf_counter() - started
+assert at.session_state['step'] == 'welcome' and not at.exception
+print(elapsed)
+"""
+
+
+def _python(code):
+    return subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=APP_DIR, capture_output=True, text=True, check=True
+    )
+
+
+def import_times(module):
+    """
+    Cumulative import time in seconds of each top-level import made while importing
+    module after streamlit, which every screen needs anyway.
+    """
+    result = _python(f'import streamlit; import {module}')
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        # Nested imports are indented; keep only top-level ones
+        if name.startswith(' ') and not name.startswith('  '):
+            times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def first_render_seconds():
+    result = _python(FIRST_RENDER_SCRIPT.format(path=os.path.join(APP_DIR, 'main.py')))
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print("Import time (ms, cumulative, after streamlit):")
+    for module in APP_MODULES + HEAVY_MODULES:
+        samples = [import_times(module).get(module, 0.0) for _ in range(args.repeat)]
+        print(f"  {module:<20} {np.median(samples) * 1000:8.1f}")
+
+    samples = [first_render_seconds() for _ in range(args.repeat)]
+    print(f"Time to first render of welcome_screen: median {np.median(samples) * 1000:.0f} ms, "
+          f"min {min(samples) * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+import numpy as np
+from constants import *
+from phases import PHASE_SPECS, display_mode
+
+# Red/black payoffs per phase and box, from the phase specification
+BOX_PAYOFFS = {
+    phase: {box: spec[box]['rewards'] for box in BOX_CODES} for phase, spec in PHASE_SPECS.items()
+}
+
+
+def observable_state(exp):
+    """
+    What a participant sees on the rounds screen: the phase, round, earnings and the
+    Box A ball count where ui.display_boxes reveals it (a 'known' box). Box B's
+    probability is never shown.
+    """
+    shown_p_safe = int(exp.p_safe * 100) / 100 if display_mode(exp.phase, 'A') == 'known' else None
+    return {
+        'phase': exp.phase,
+        'round': exp.round,
+        'cumulative_earnings': exp.cumulative_earnings,
+        'p_safe': shown_p_safe,
+    }
+
+
+class Strategy:
+    """
+    Behavioural policy. choose() receives the observable state and the outcomes of
+    earlier rounds in this phase as (box, result, reward) tuples, and returns 'A' or 'B'.
+    """
+    name = 'base'
+
+    def __init__(self, rng=None):
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+    def start_phase(self, phase):
+        pass
+
+    def choose(self, state, history):
+        raise NotImplementedError
+
+    def update(self, box, result, reward):
+        pass
+
+
+class AlwaysA(Strategy):
+    name = 'always_a'
+
+    def choose(self, state, history):
+        return 'A'
+
+
+class AlwaysB(Strategy):
+    name = 'always_b'
+
+    def choose(self, state, history):
+        return 'B'
+
+
+class WinStayLoseShift(Strategy):
+    name = 'win_stay_lose_shift'
+
+    def choose(self, state, history):
+        if not history:
+            return 'A' if self.rng.random() < 0.5 else 'B'
+        box, _, reward = history[-1]
+        if reward > 0:
+            return box
+        return 'B' if box == 'A' else 'A'
+
+
+class ProbabilityLearner(Strategy):
+    """
+    Tracks the red-ball share of each box with a recency-weighted average, since the
+    box probabilities drift every round, and picks the higher expected value. A
+    shown Box A probability is used directly. Gold/silver draws update a separate
+    estimate of the mean surprise payoff.
+    """
+    name = 'probability_learner'
+
+    def __init__(self, rng=None, learning_rate=0.2):
+        super().__init__(rng)
+        self.learning_rate = learning_rate
+
+    def start_phase(self, phase):
+        self.phase = phase
+        self.p_red = {'A': 0.5, 'B': 0.5}
+        self.special_rate = 0.0
+        self.special_value = 0.0
+
+    def update(self, box, result, reward):
+        lr = self.learning_rate
+        if box == 'B':
+            is_special = result in ('gold', 'silver')
+            self.special_rate += lr * (is_special - self.special_rate)
+            if is_special:
+                self.special_value += lr * (reward - self.special_value)
+                return
+        self.p_red[box] += lr * ((result == 'red') - self.p_red[box])
+
+    def expected_values(self, state):
+        values = {}
+        for box in ('A', 'B'):
+            p = state['p_safe'] if box == 'A' and state['p_safe'] is not None else self.p_red[box]
+            win, loss = BOX_PAYOFFS[self.phase][box]
+            values[box] = p * win + (1 - p) * loss
+        values['B'] = (1 - self.special_rate) * values['B'] + self.special_rate * self.special_value
+        return values
+
+    def choose(self, state, history):
+        values = self.expected_values(state)
+        return 'A' if values['A'] >= values['B'] else 'B'
+
+
+class SoftmaxAmbiguityAverse(ProbabilityLearner):
+    """
+    Softmax over expected values, where every box whose probability is hidden is
+    penalised by ambiguity_aversion euros.
+    """
+    name = 'softmax_ambiguity_averse'
+
+    def __init__(self, rng=None, learning_rate=0.2, inverse_temperature=0.5, ambiguity_aversion=2.0):
+        super().__init__(rng, learning_rate)
+        self.inverse_temperature = inverse_temperature
+        self.ambiguity_aversion = ambiguity_aversion
+
+    def choose(self, state, history):
+        values = self.expected_values(state)
+        if state['p_safe'] is None:
+            values['A'] -= self.ambiguity_aversion
+        values['B'] -= self.ambiguity_aversion
+        p_a = 1.0 / (1.0 + np.exp(-self.inverse_temperature * (values['A'] - values['B'])))
+        return 'A' if self.rng.random() < p_a else 'B'
+
+
+STRATEGIES = {
+    cls.name: cls for cls in (AlwaysA, AlwaysB, WinStayLoseShift, ProbabilityLearner, SoftmaxAmbiguityAverse)
+}
@@ -0,0 +1,213 @@
+"""
+Chunked, memory-bounded reader and validator for the results CSV.
+
+The file is read CHUNK_BYTES at a time (optionally through mmap) and split on line
+boundaries, so peak memory depends on the chunk size and not on the file size.
+Each chunk becomes a typed DataFrame in the current RESULTS_HEADER layout. With
+mmap, pages already read still show up in RSS, but they are clean page cache that
+the kernel can drop under memory pressure.
+
+Rows written before session_id was added have one field less and are mapped by
+their field count, so files that mix both layouts under a single header still
+line up. Header lines repeated mid-file (e.g. after concatenating files) are
+skipped. Rows that fail the schema checks are dropped and reported, or raise in
+strict mode.
+
+    python streaming.py [experiment_data_all.csv] [--mmap] [--strict]
+"""
+import csv
+import io
+import mmap
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from constants import PHASES, ROUNDS_PER_PHASE, BOX_CODES, RESULT_CODES, RESULTS_HEADER, RESULTS_FILE
+
+CHUNK_BYTES = 8 * 1024 * 1024
+# Known layouts by number of fields; a header naming other columns adds its own
+LAYOUTS = {
+    len(RESULTS_HEADER): RESULTS_HEADER,
+    len(RESULTS_HEADER) - 1: RESULTS_HEADER[1:],  # before session_id was added
+}
+RESULTS_DTYPES = {
+    'session_id': 'string',
+    'participant_id': 'int64',
+    'professional_area': 'category',
+    'phase': 'int8',
+    'round': 'int8',
+    'box_chosen': pd.CategoricalDtype(BOX_CODES),
+    'decision_time': 'float64',
+    'result': pd.CategoricalDtype(RESULT_CODES),
+    'reward': 'int16',
+    'cumulative_earnings': 'int32',
+    'p_safe': 'float64',
+    'p_uncertain': 'float64',
+    'init_p_safe': 'float64',
+    'init_p_uncertain': 'float64',
+}
+NUMERIC_COLUMNS = [c for c, t in RESULTS_DTYPES.items() if t in ('int8', 'int16', 'int32', 'int64', 'float64')]
+# Blank in older files (init probabilities were never filled in before the lookup fix)
+OPTIONAL_COLUMNS = ['session_id', 'init_p_safe', 'init_p_uncertain']
+HEADER_PREFIXES = (b'session_id,', b'participant_id,')
+
+
+def _chunks(path, chunk_bytes=CHUNK_BYTES, use_mmap=False):
+    """Yield (byte offset, bytes) pieces of the file that end on a line boundary."""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        if use_mmap:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                pos = 0
+                while pos < size:
+                    end = mm.rfind(b'\n', pos, min(pos + chunk_bytes, size)) + 1
+                    if end <= pos:
+                        # A line longer than one chunk: extend to its end
+                        end = mm.find(b'\n', pos + chunk_bytes) + 1 or size
+                    yield pos, mm[pos:end]
+                    pos = end
+            return
+        pos = 0
+        carry = b''
+        while True:
+            block = f.read(chunk_bytes)
+            if not block:
+                break
+            block = carry + block
+            end = block.rfind(b'\n') + 1
+            if end == 0:
+                carry = block
+                continue
+            yield pos, block[:end]
+            pos += end
+            carry = block[end:]
+        if carry:
+            yield pos, carry
+
+
+def _field_counts(buf):
+    """Line start offsets, end offsets and field counts of a chunk, vectorised."""
+    arr = np.frombuffer(buf, dtype=np.uint8)
+    ends = np.flatnonzero(arr == ord('\n'))
+    if not buf.endswith(b'\n'):
+        ends = np.append(ends, len(buf))
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    if b'"' in buf:
+        # Quoted fields may contain commas; count those lines properly
+        counts = np.array([
+            len(next(csv.reader([buf[s:e].decode('utf-8')]), [])) for s, e in zip(starts, ends)
+        ])
+    else:
+        commas = np.flatnonzero(arr == ord(','))
+        counts = np.searchsorted(commas, ends) - np.searchsorted(commas, starts) + 1
+    # Empty lines have no fields
+    counts[ends - starts <= 1] = 0
+    return starts, ends, counts
+
+
+def _parse(buf, layout):
+    # session_id stays text; numeric-looking ids would otherwise become floats next to blanks
+    return pd.read_csv(io.BytesIO(buf), header=None, names=layout, dtype={'session_id': str})
+
+
+def validate_batch(df):
+    """Boolean mask of the rows that break the schema. Expects numeric columns already coerced."""
+    required = [c for c in RESULTS_HEADER if c not in OPTIONAL_COLUMNS]
+    invalid = df[required].isna().any(axis=1)
+    invalid |= ~df['phase'].isin(PHASES)
+    invalid |= ~df['round'].between(1, ROUNDS_PER_PHASE)
+    invalid |= ~df['box_chosen'].isin(BOX_CODES)
+    invalid |= ~df['result'].isin(RESULT_CODES)
+    for col in ['p_safe', 'p_uncertain', 'init_p_safe', 'init_p_uncertain']:
+        invalid |= df[col].notna() & ~df[col].between(0, 1)
+    return invalid.to_numpy()
+
+
+def _typed(df):
+    df = df.reindex(columns=RESULTS_HEADER)
+    for col in NUMERIC_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    invalid = validate_batch(df)
+    df = df[~invalid]
+    df = df.assign(session_id=df['session_id'].fillna('').astype(str)).astype(RESULTS_DTYPES)
+    return df.reset_index(drop=True), int(invalid.sum())
+
+
+def _split_by_layout(buf, layouts):
+    """Parse a chunk into frames per layout, indexed by line number, dropping repeated header lines."""
+    starts, ends, counts = _field_counts(buf)
+    headers = np.array([buf[s:s + 16].startswith(HEADER_PREFIXES) for s in starts]) \
+        if any(p in buf for p in HEADER_PREFIXES) else np.zeros(len(starts), bool)
+    unknown = 0
+    frames = []
+    kinds = np.unique(counts[(counts > 0) & ~headers])
+    if len(kinds) == 1 and not headers.any() and kinds[0] in layouts:
+        # Common case: the whole chunk has one layout
+        return [_parse(buf, layouts[kinds[0]])], 0
+    for count in kinds:
+        lines = np.flatnonzero((counts == count) & ~headers)
+        if count not in layouts:
+            unknown += len(lines)
+            continue
+        joined = b'\n'.join(buf[starts[i]:ends[i]] for i in lines) + b'\n'
+        frame = _parse(joined, layouts[count])
+        frame.index = lines  # line numbers, to restore file order after the concat
+        frames.append(frame)
+    return frames, unknown
+
+
+def iter_results(path=RESULTS_FILE, chunk_bytes=CHUNK_BYTES, use_mmap=False, strict=False):
+    """
+    Yield typed DataFrames of at most about chunk_bytes of CSV each, in the current
+    RESULTS_HEADER layout. Invalid rows are dropped and reported, or raise a
+    ValueError when strict is set.
+    """
+    layouts = dict(LAYOUTS)
+    first = True
+    for offset, buf in _chunks(path, chunk_bytes, use_mmap):
+        if first:
+            first = False
+            line_end = buf.find(b'\n') + 1 or len(buf)
+            names = buf[:line_end].decode('utf-8').strip().split(',')
+            if 'participant_id' in names:
+                if set(names) <= set(RESULTS_HEADER):
+                    layouts[len(names)] = names
+                else:
+                    print(f"{path}: unknown columns in header {sorted(set(names) - set(RESULTS_HEADER))}")
+                buf = buf[line_end:]
+                offset += line_end
+                if not buf:
+                    continue
+        frames, unknown = _split_by_layout(buf, layouts)
+        batch, invalid = _typed(pd.concat(frames).sort_index()) if frames else \
+            (pd.DataFrame(columns=RESULTS_HEADER).astype(RESULTS_DTYPES), 0)
+        invalid += unknown
+        if invalid:
+            message = f"{path}: {invalid} invalid rows in the batch at byte {offset}"
+            if strict:
+                raise ValueError(message)
+            print(message)
+        if len(batch):
+            yield batch
+
+
+def validate_file(path=RESULTS_FILE, chunk_bytes=CHUNK_BYTES, use_mmap=False, strict=False):
+    """Stream the whole file and return (valid rows, batches) without keeping the rows."""
+    rows = batches = 0
+    for batch in iter_results(path, chunk_bytes, use_mmap, strict):
+        rows += len(batch)
+        batches += 1
+    return rows, batches
+
+
+if __name__ == '__main__':
+    import resource
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    path = args[0] if args else RESULTS_FILE
+    rows, batches = validate_file(path, use_mmap='--mmap' in sys.argv, strict='--strict' in sys.argv)
+    print(f"{path}: {rows} valid rows in {batches} batches, "
+          f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
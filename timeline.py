@@ -0,0 +1,66 @@
+import streamlit as st
+from functools import lru_cache
+from metrics import timed
+from warmup import wait_for_warmup
+
+EARNINGS_LABEL = 'Cumulative Earnings (€)'
+PLOTLY_CONFIG = {
+    'displayModeBar': False,  # This removes all the toolbar icons
+    'staticPlot': False  # Keep it interactive for hover, but no toolbar
+}
+
+@lru_cache(maxsize=None)
+def _base_figure(display_phase_num):
+    # Built once per phase and process; sessions work on copies
+    wait_for_warmup()
+    import plotly.graph_objects as go
+    fig = go.Figure(go.Scatter(
+        x=[], y=[], mode='lines+markers',
+        hovertemplate=f"Round=%{{x}}<br>{EARNINGS_LABEL}=%{{y}}<extra></extra>"
+    ))
+    fig.update_layout(
+        title=f"Phase {display_phase_num} - Earnings Progress",
+        height=400,
+        showlegend=False,
+        xaxis_title="Round",
+        yaxis_title=EARNINGS_LABEL
+    )
+    # Horizontal line at y=0
+    fig.add_hline(y=0, line_dash="dash", line_color="gray", opacity=0.7)
+    return fig
+
+@timed('experiment_chart_build_seconds')
+def _session_figure(display_phase_num, rounds, earnings):
+    """
+    Return this session's figure for the phase, appending only the points added since
+    the last rerun. begin_rounds clears timeline_state, which starts a new figure.
+    """
+    wait_for_warmup()
+    import plotly.graph_objects as go
+    state = st.session_state.get('timeline_state')
+    if state is None or state['phase'] != display_phase_num or state['points'] > len(rounds):
+        state = {
+            'phase': display_phase_num,
+            'figure': go.Figure(_base_figure(display_phase_num)),
+            'points': 0,
+        }
+        st.session_state['timeline_state'] = state
+    if state['points'] < len(rounds):
+        trace = state['figure'].data[0]
+        trace.x = tuple(trace.x) + tuple(rounds[state['points']:].tolist())
+        trace.y = tuple(trace.y) + tuple(earnings[state['points']:].tolist())
+        state['points'] = len(rounds)
+    return state['figure']
+
+def earnings_timeline(display_phase_num, rounds, earnings):
+    """
+    Cumulative earnings chart for the current phase, from the round and earnings
+    arrays of the round log. Uses plotly when available and falls back to
+    Streamlit's native line chart otherwise.
+    """
+    try:
+        fig = _session_figure(display_phase_num, rounds, earnings)
+    except ImportError:
+        st.line_chart({'Round': rounds.tolist(), EARNINGS_LABEL: earnings.tolist()}, x='Round', y=EARNINGS_LABEL, height=400)
+        return
+    st.plotly_chart(fig, use_container_width=True, config=PLOTLY_CONFIG)
@@ -1,115 +1,81 @@
 import streamlit as st
+from functools import lru_cache
 from constants import *
+from metrics import timed
+from phases import BOX_INDEX, DISPLAY_LABELS, PHASE_SPECS, display_mode
 
+# Shared stylesheet for the ball grids; each ball is then a bare <i> element
+BOX_CSS = """<style>
+.rx-grid{display:grid;grid-template-columns:repeat(10,1fr);gap:2px;max-width:200px}
+.rx-grid i{display:block;width:15px;height:15px;border-radius:50%;background-color:#e0e0e0}
+.rx-grid.rx-q i{background-color:#888}
+.rx-grid.rx-q i::after{content:'?';display:block;color:white;font-size:8px;font-style:normal;text-align:center;line-height:15px}
+.rx-info{margin-top:28px;margin-bottom:32px;padding:12px 0;text-align:center;max-width:200px;margin-left:0;margin-right:auto;background:rgba(255,255,255,0.04);border-radius:12px}
+.rx-info div{font-weight:600}
+.rx-info .rx-line{margin-top:2px}
+.rx-info .rx-big{margin-top:2px;font-size:1.18em;font-weight:700}
+.rx-spacer{height:24px}
+</style>"""
+
+BALLS = "<i></i>" * 100
+
+def _known_box_html(safe_balls, win, loss):
+    # Blue for winning balls, gray for losing; the first safe_balls children are blue
+    return f"""<style>.rx-k{safe_balls} i:nth-child(-n+{safe_balls}){{background-color:#4285f4}}</style>
+<div class='rx-grid rx-k{safe_balls}'>{BALLS}</div>
+<div class='rx-info'><div>{safe_balls}% chance of winning {win}€</div><div class='rx-line'>{100-safe_balls}% chance of losing {abs(loss)}€</div></div>
+<div class='rx-spacer'></div>"""
+
+def _unknown_box_html(info):
+    return f"""<div class='rx-grid rx-q'>{BALLS}</div>
+<div class='rx-info'>{info}</div>
+<div class='rx-spacer'></div>"""
+
+def _ambiguity_info(win, loss):
+    return f"<div>Unknown probability</div><div class='rx-big'>Win {win}€ or lose {abs(loss)}€</div>"
+
+RUMSFELD_INFO = "<div>Totally different rules might apply</div>"
+
+def _single_box_html(phase, box, safe_balls):
+    win, loss = PHASE_SPECS[phase][box]['rewards']
+    mode = display_mode(phase, box)
+    if mode == 'known':  # Risk - blue/gray balls
+        return _known_box_html(safe_balls, win, loss)
+    if mode == 'ambiguity':  # Unknown probability - question marks, stakes shown
+        return _unknown_box_html(_ambiguity_info(win, loss))
+    return _unknown_box_html(RUMSFELD_INFO)  # Rumsfeld - no information revealed
+
+@lru_cache(maxsize=None)
+def box_html(phase, safe_balls):
+    """
+    HTML for Box A and Box B, cached per (phase, safe_balls). Box B never reveals
+    its probability, so it does not depend on p_uncertain.
+    """
+    return tuple(_single_box_html(phase, box, safe_balls) for box in BOX_INDEX)
+
+@timed('experiment_display_boxes_seconds')
 def display_boxes(phase, p_safe, p_uncertain, show_special=False):
     """
-    Display two boxes with probability visualization using simple HTML/CSS grid
+    Display two boxes with probability visualization using a shared CSS grid
     """
-    # Calculate number of colored balls for each box
+    # Calculate number of colored balls for Box A
     safe_balls = int(p_safe * 100)
-    uncertain_balls = int(p_uncertain * 100)
-    
-    # Create HTML for the boxes
+    box_a, box_b = box_html(phase, safe_balls)
+
+    # Streamlit drops elements a rerun does not emit, so the stylesheet goes out every rerun
+    st.markdown(BOX_CSS, unsafe_allow_html=True)
     col1, col2 = st.columns(2)
-    
     with col1:
         st.markdown("**Box A**")
-        
-        # Show different visualizations based on phase
-        if phase == 1 or phase == 2:  # Box A is known (risk) - show blue/white balls
-            balls_html = "<div style='display: grid; grid-template-columns: repeat(10, 1fr); gap: 2px; max-width: 200px;'>"
-            for i in range(100):
-                color = "#4285f4" if i < safe_balls else "#e0e0e0"  # Blue for winning balls, gray for losing
-                balls_html += f"<div style='width: 15px; height: 15px; border-radius: 50%; background-color: {color};'></div>"
-            balls_html += "</div>"
-            st.markdown(balls_html, unsafe_allow_html=True)
-            
-            # Show exact probability information for known risk
-            info_html = f"""
-            <div style='margin-top: 28px; margin-bottom: 32px; padding: 12px 0 12px 0; text-align: center; max-width: 200px; margin-left: 0; margin-right: auto; background: rgba(255,255,255,0.04); border-radius: 12px;'>
-                <div style='font-weight: 600;'>{safe_balls}% chance of winning {REWARD_RED}€</div>
-                <div style='margin-top: 2px; font-weight: 600;'>{100-safe_balls}% chance of losing {abs(REWARD_BLACK)}€</div>
-            </div>
-            """
-            st.markdown(info_html, unsafe_allow_html=True)
-            st.markdown("<div style='height: 24px;'></div>", unsafe_allow_html=True)
-            
-        elif phase == 3:  # Box A is unknown (ambiguity) - show question marks
-            balls_html = "<div style='display: grid; grid-template-columns: repeat(10, 1fr); gap: 2px; max-width: 200px;'>"
-            for i in range(100):
-                balls_html += "<div style='width: 15px; height: 15px; border-radius: 50%; background-color: #888; color: white; font-size: 8px; text-align: center; line-height: 15px;'>?</div>"
-            balls_html += "</div>"
-            st.markdown(balls_html, unsafe_allow_html=True)
-            
-            # Show unknown probability information
-            info_html = f"""
-            <div style='margin-top: 28px; margin-bottom: 32px; padding: 12px 0 12px 0; text-align: center; max-width: 200px; margin-left: 0; margin-right: auto; background: rgba(255,255,255,0.04); border-radius: 12px;'>
-                <div style='font-weight: 600;'>Unknown probability</div>
-                <div style='margin-top: 2px; font-size: 1.18em; font-weight: 700;'>Win {AMBIGUITY_REWARD}€ or lose {abs(AMBIGUITY_LOSS)}€</div>
-            </div>
-            """
-            st.markdown(info_html, unsafe_allow_html=True)
-            st.markdown("<div style='height: 24px;'></div>", unsafe_allow_html=True)
-    
+        st.markdown(box_a, unsafe_allow_html=True)
     with col2:
         st.markdown("**Box B**")
-        # For unknown probability boxes, show question marks or different visualization based on phase
-        if phase == 1:  # Ambiguity - all question marks
-            balls_html = "<div style='display: grid; grid-template-columns: repeat(10, 1fr); gap: 2px; max-width: 200px;'>"
-            for i in range(100):
-                balls_html += "<div style='width: 15px; height: 15px; border-radius: 50%; background-color: #888; color: white; font-size: 8px; text-align: center; line-height: 15px;'>?</div>"
-            balls_html += "</div>"
-            st.markdown(balls_html, unsafe_allow_html=True)
-            # Box B information for phase 1 (ambiguity)
-            info_html = f"""
-            <div style='margin-top: 28px; margin-bottom: 32px; padding: 12px 0 12px 0; text-align: center; max-width: 200px; margin-left: 0; margin-right: auto; background: rgba(255,255,255,0.04); border-radius: 12px;'>
-                <div style='font-weight: 600;'>Unknown probability</div>
-                <div style='margin-top: 2px; font-size: 1.18em; font-weight: 700;'>Win {AMBIGUITY_REWARD}€ or lose {abs(AMBIGUITY_LOSS)}€</div>
-            </div>
-            """
-            st.markdown(info_html, unsafe_allow_html=True)
-            st.markdown("<div style='height: 24px;'></div>", unsafe_allow_html=True)
-            
-        elif phase == 2 or phase == 3:  # Rumsfeld - all question marks (no information revealed)
-            balls_html = "<div style='display: grid; grid-template-columns: repeat(10, 1fr); gap: 2px; max-width: 200px;'>"
-            for i in range(100):
-                balls_html += "<div style='width: 15px; height: 15px; border-radius: 50%; background-color: #888; color: white; font-size: 8px; text-align: center; line-height: 15px;'>?</div>"
-            balls_html += "</div>"
-            st.markdown(balls_html, unsafe_allow_html=True)
-            # Box B information for phases 2&3 (Rumsfeld uncertainty)
-            if phase == 2:
-                info_html = f"""
-                <div style='margin-top: 28px; margin-bottom: 32px; padding: 12px 0 12px 0; text-align: center; max-width: 200px; margin-left: 0; margin-right: auto; background: rgba(255,255,255,0.04); border-radius: 12px;'>
-                    <div style='font-weight: 600;'>Totally different rules might apply</div>
-                </div>
-                """
-                st.markdown(info_html, unsafe_allow_html=True)
-                st.markdown("<div style='height: 24px;'></div>", unsafe_allow_html=True)
-            else:  # phase == 3
-                info_html = f"""
-                <div style='margin-top: 28px; margin-bottom: 32px; padding: 12px 0 12px 0; text-align: center; max-width: 200px; margin-left: 0; margin-right: auto; background: rgba(255,255,255,0.04); border-radius: 12px;'>
-                    <div style='font-weight: 600;'>Totally different rules might apply</div>
-                </div>
-                """
-                st.markdown(info_html, unsafe_allow_html=True)
-                st.markdown("<div style='height: 24px;'></div>", unsafe_allow_html=True)
+        st.markdown(box_b, unsafe_allow_html=True)
 
 def show_instructions(phase):
-    if phase == 1:
-        st.markdown("""
-        - **Box A:** Known probability (risk)
-        - **Box B:** Unknown probability (ambiguity)
-        """)
-    elif phase == 2:
-        st.markdown("""
-        - **Box A:** Known probability (risk)
-        - **Box B:** Totally different rules might apply
-        """)
-    elif phase == 3:
-        st.markdown("""
-        - **Box A:** Unknown probability (ambiguity)
-        - **Box B:** Totally different rules might apply
-        """)
+    st.markdown("\n".join(
+        f"- **Box {box}:** {DISPLAY_LABELS[display_mode(phase, box)]}" for box in BOX_INDEX
+    ))
 
 def show_feedback(result, reward, box):
     if result == 'red':
@@ -0,0 +1,261 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+WAL_FILE = 'experiment_wal.sqlite3'
+REPLAY_INTERVAL = 15.0  # Seconds between background replay attempts
+REPLAY_MAX_ENTRIES = 500  # Entries pushed to a worksheet in one bulk append
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 300.0
+
+
+def _json_default(value):
+    # numpy scalars are not JSON serializable
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def row_keys(df, key_columns):
+    """One string key per row; numbers and their CSV text form give the same key."""
+    return ['\x1f'.join(map(_key_part, values)) for values in df[key_columns].itertuples(index=False, name=None)]
+
+
+def _key_part(value):
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def _payload_frame(payload):
+    import pandas as pd
+    entry = json.loads(payload)
+    return pd.DataFrame(entry['rows'], columns=entry['columns'])
+
+
+class WriteAheadLog:
+    """
+    Durable local log of every batch destined for Google Sheets and the local files.
+    Entries are committed before any other write and replayed in bulk; a per-worksheet
+    high-water mark records the last entry that landed, so successful rows are never
+    resent, and a per-entry flag records whether its local copy was written.
+    Failed pushes and failed local copies back off exponentially up to BACKOFF_MAX seconds.
+
+    push(df, worksheet) and write_local(df, worksheet) return True on success.
+    Worksheets in local_only are only ever written locally.
+    """
+
+    def __init__(self, path=WAL_FILE, push=None, write_local=None, local_only=()):
+        self.path = path
+        self.push = push
+        self.write_local = write_local
+        self.local_only = set(local_only)
+        self._replay_lock = threading.Lock()
+        self._local_lock = threading.Lock()
+        self._local_backoff = {}  # worksheet -> (failures, next_attempt) of its local copies
+        self._replayer = None
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, worksheet TEXT NOT NULL, "
+                "payload TEXT NOT NULL, created REAL NOT NULL, local_done INTEGER NOT NULL DEFAULT 0)"
+            )
+            if 'local_done' not in [row[1] for row in db.execute("PRAGMA table_info(entries)")]:
+                # Entries logged before the flag existed had their local copy written in the same call
+                db.execute("ALTER TABLE entries ADD COLUMN local_done INTEGER NOT NULL DEFAULT 1")
+            db.execute("CREATE INDEX IF NOT EXISTS entries_local ON entries (id) WHERE local_done = 0")
+            # Row keys already logged per worksheet, so a batch submitted twice is logged once
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS written_keys ("
+                "worksheet TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (worksheet, key)) WITHOUT ROWID"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS sync_state ("
+                "worksheet TEXT PRIMARY KEY, high_water INTEGER NOT NULL DEFAULT 0, "
+                "failures INTEGER NOT NULL DEFAULT 0, next_attempt REAL NOT NULL DEFAULT 0)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def append(self, worksheet, df, key_columns=None):
+        """
+        Log df for the worksheet and return the rows that were logged. With key_columns,
+        rows whose key was logged before are dropped, in the same transaction that
+        records the new keys; each check is one primary-key lookup. Nothing else is
+        written here: copy_local and replay take the rows from the log.
+        """
+        with self._connect() as db:
+            if key_columns:
+                keys = row_keys(df, key_columns)
+                fresh = [
+                    db.execute("INSERT OR IGNORE INTO written_keys VALUES (?, ?)", (worksheet, key)).rowcount == 1
+                    for key in keys
+                ]
+                if not all(fresh):
+                    print(f"Dropped {fresh.count(False)} duplicate rows for {worksheet}")
+                    df = df[fresh]
+            if df.empty:
+                return df
+            self._insert(db, worksheet, df)
+        return df
+
+    def mark_written(self, worksheet, keys):
+        """Record keys as written without logging rows, e.g. for rows already in the CSVs."""
+        with self._connect() as db:
+            db.executemany("INSERT OR IGNORE INTO written_keys VALUES (?, ?)", ((worksheet, k) for k in keys))
+
+    def _insert(self, db, worksheet, df):
+        payload = json.dumps({
+            'columns': list(df.columns),
+            'rows': df.astype(object).where(df.notna(), None).values.tolist(),
+        }, default=_json_default)
+        cur = db.execute(
+            "INSERT INTO entries (worksheet, payload, created, local_done) VALUES (?, ?, ?, ?)",
+            (worksheet, payload, time.time(), int(self.write_local is None))
+        )
+        if worksheet not in self.local_only:
+            db.execute("INSERT OR IGNORE INTO sync_state (worksheet) VALUES (?)", (worksheet,))
+        return cur.lastrowid
+
+    def high_water(self, worksheet):
+        with self._connect() as db:
+            row = db.execute("SELECT high_water FROM sync_state WHERE worksheet = ?", (worksheet,)).fetchone()
+        return row[0] if row else 0
+
+    def pending(self, worksheet=None):
+        """Number of entries not yet pushed, for one worksheet or all of them."""
+        query = (
+            "SELECT COUNT(*) FROM entries e JOIN sync_state s ON e.worksheet = s.worksheet "
+            "WHERE e.id > s.high_water"
+        )
+        args = ()
+        if worksheet is not None:
+            query += " AND e.worksheet = ?"
+            args = (worksheet,)
+        with self._connect() as db:
+            return db.execute(query, args).fetchone()[0]
+
+    def pending_local(self):
+        """Number of entries whose local copy is not written yet."""
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM entries WHERE local_done = 0").fetchone()[0]
+
+    def _unsynced(self, db, worksheet, high_water):
+        import pandas as pd
+        rows = db.execute(
+            "SELECT id, payload FROM entries WHERE worksheet = ? AND id > ? ORDER BY id LIMIT ?",
+            (worksheet, high_water, REPLAY_MAX_ENTRIES)
+        ).fetchall()
+        if not rows:
+            return None, 0, high_water
+        frames = [_payload_frame(payload) for _, payload in rows]
+        return pd.concat(frames, ignore_index=True), len(rows), rows[-1][0]
+
+    def copy_local(self, force=False):
+        """
+        Write the local copies of logged entries, oldest first. A worksheet whose copy
+        fails backs off and its later entries wait, so its file keeps the log order;
+        force ignores the backoff. Returns True if no local copy is left pending.
+        """
+        if self.write_local is None:
+            return True
+        with self._local_lock:
+            now = time.time()
+            skipped = {w for w, (_, next_attempt) in self._local_backoff.items() if not force and now < next_attempt}
+            while True:
+                query = "SELECT id, worksheet, payload FROM entries WHERE local_done = 0"
+                if skipped:
+                    query += f" AND worksheet NOT IN ({', '.join('?' * len(skipped))})"
+                with self._connect() as db:
+                    rows = db.execute(query + " ORDER BY id LIMIT ?", (*skipped, REPLAY_MAX_ENTRIES)).fetchall()
+                if not rows:
+                    return not skipped
+                for entry_id, worksheet, payload in rows:
+                    if worksheet in skipped:
+                        continue
+                    if not self.write_local(_payload_frame(payload), worksheet):
+                        failures = self._local_backoff.get(worksheet, (0, 0))[0] + 1
+                        self._local_backoff[worksheet] = (
+                            failures, time.time() + min(BACKOFF_MAX, BACKOFF_BASE ** failures)
+                        )
+                        metrics.inc('experiment_wal_local_failures_total', worksheet=worksheet)
+                        skipped.add(worksheet)
+                        continue
+                    self._local_backoff.pop(worksheet, None)
+                    with self._connect() as db:
+                        db.execute("UPDATE entries SET local_done = 1 WHERE id = ?", (entry_id,))
+
+    def replay(self, force=False):
+        """
+        Push unsynced entries of every worksheet in one bulk append each. Worksheets in
+        backoff are skipped unless force is set. Returns the number of rows pushed.
+        """
+        if self.push is None or not self._replay_lock.acquire(blocking=False):
+            return 0
+        pushed = 0
+        try:
+            with self._connect() as db:
+                states = db.execute("SELECT worksheet, high_water, failures, next_attempt FROM sync_state").fetchall()
+            for worksheet, high_water, failures, next_attempt in states:
+                if not force and time.time() < next_attempt:
+                    continue
+                while True:
+                    with self._connect() as db:
+                        df, entries, last_id = self._unsynced(db, worksheet, high_water)
+                    if df is None:
+                        break
+                    if failures:
+                        metrics.inc('experiment_wal_retries_total', worksheet=worksheet)
+                    ok = self.push(df, worksheet)
+                    with self._connect() as db:
+                        if not ok:
+                            delay = min(BACKOFF_MAX, BACKOFF_BASE ** (failures + 1))
+                            db.execute(
+                                "UPDATE sync_state SET failures = ?, next_attempt = ? WHERE worksheet = ?",
+                                (failures + 1, time.time() + delay, worksheet)
+                            )
+                            break
+                        db.execute(
+                            "UPDATE sync_state SET high_water = ?, failures = 0, next_attempt = 0 WHERE worksheet = ?",
+                            (last_id, worksheet)
+                        )
+                    pushed += len(df)
+                    high_water = last_id
+                    if entries < REPLAY_MAX_ENTRIES:
+                        break
+        finally:
+            self._replay_lock.release()
+        return pushed
+
+    def start_replayer(self, interval=REPLAY_INTERVAL):
+        """Retry unsynced entries in the background, even when no new writes arrive."""
+        if self._replayer is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    if self.pending_local():
+                        self.copy_local()
+                    if self.pending():
+                        self.replay()
+                except Exception as e:
+                    print(f"Write-ahead log replay failed: {e}")
+
+        self._replayer = threading.Thread(target=run, name='wal-replayer', daemon=True)
+        self._replayer.start()
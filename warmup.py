@@ -0,0 +1,38 @@
+import importlib
+import threading
+import time
+
+import streamlit as st
+
+# Heavy dependencies the later screens need; imported off the request path
+WARM_MODULES = ['pandas', 'plotly.graph_objects', 'streamlit_gsheets']
+import_times = {}
+_thread = None
+
+def _warm():
+    for name in WARM_MODULES:
+        started = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f"Warm-up import of {name} failed: {e}")
+            continue
+        import_times[name] = time.perf_counter() - started
+
+@st.cache_resource
+def start_warmup():
+    """Import heavy modules in a background thread, once per server process."""
+    global _thread
+    thread = threading.Thread(target=_warm, name='warm-up', daemon=True)
+    _thread = thread
+    thread.start()
+    return thread
+
+def wait_for_warmup():
+    """
+    Block until the warm-up imports are done. Call before importing a WARM_MODULES
+    module: two threads importing pandas or plotly at once can see a partially
+    initialized module.
+    """
+    if _thread is not None and _thread is not threading.current_thread():
+        _thread.join()
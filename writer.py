@@ -0,0 +1,177 @@
+import atexit
+import queue
+import threading
+import time
+
+import metrics
+from data import (
+    build_round_dataframe, build_questionnaire_dataframe, build_seeds_dataframe,
+    write_round_dataframe, write_questionnaire_dataframe, write_seeds_dataframe, session_store
+)
+
+FLUSH_INTERVAL = 1.0  # Seconds to wait for more batches before flushing
+DRAIN_TIMEOUT = 30.0  # Seconds allowed for the final flush at shutdown
+RETRY_BASE = 2.0  # Seconds before retrying a failed flush, doubled per consecutive failure
+RETRY_MAX = 60.0
+
+
+class WriteBehindQueue:
+    """
+    Process-wide background writer. Callers submit round and questionnaire batches
+    and return immediately; a worker thread coalesces everything that arrived within
+    FLUSH_INTERVAL into one CSV append and one Sheets append per worksheet. Batches
+    whose write raised are held and retried with the next flush, or after a backoff.
+    """
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stopping = False
+        self.batches_flushed = 0
+        self.rows_flushed = 0
+        self.errors = 0
+        self.last_flush_seconds = None
+        self.total_flush_seconds = 0.0
+        self._failed = []  # Jobs whose write raised, retried with the next flush
+        self._retries = 0
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    # --- Producer side ---
+    def submit_rounds(self, data, participant_id, initial_probs=None, seeds=None):
+        # Build the frame now so later mutations of the session state cannot leak in
+        df = build_round_dataframe(data, participant_id, initial_probs)
+        self._queue.put(('rounds', df))
+        if seeds:
+            self._queue.put(('seeds', build_seeds_dataframe(data, seeds)))
+
+    def submit_questionnaire(self, participant_id, phase, responses):
+        df = build_questionnaire_dataframe(participant_id, phase, responses)
+        self._queue.put(('questionnaire', df))
+
+    def submit_completion(self, session_id):
+        """
+        Mark the session completed in the session store once every batch submitted
+        before it is in the write-ahead log; until then it stays resumable.
+        """
+        self._queue.put(('complete', session_id))
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._lock:
+            flushes = self.batches_flushed
+            return {
+                'queue_depth': self.depth(),
+                'batches_flushed': flushes,
+                'rows_flushed': self.rows_flushed,
+                'errors': self.errors,
+                'failed_rows': sum(len(df) for kind, df in self._failed if kind != 'complete'),
+                'last_flush_seconds': self.last_flush_seconds,
+                'mean_flush_seconds': self.total_flush_seconds / flushes if flushes else None,
+            }
+
+    def drain(self, timeout=DRAIN_TIMEOUT):
+        """
+        Flush everything still queued, retrying failed batches once more, and stop the
+        worker. Returns True if everything was written within the timeout.
+        """
+        self._stopping = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+        with self._lock:
+            return not self._thread.is_alive() and not self._failed
+
+    # --- Worker side ---
+    def _collect(self):
+        # Block for the first batch, then gather whatever arrives within the flush window
+        jobs = []
+        if self._failed:
+            # Wake up to retry the held batches even if nothing new arrives
+            delay = min(RETRY_MAX, RETRY_BASE ** self._retries)
+            try:
+                first = self._queue.get(timeout=delay)
+            except queue.Empty:
+                return jobs, False
+        else:
+            first = self._queue.get()
+        if first is None:
+            return jobs, True
+        jobs.append(first)
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            remaining = deadline - time.monotonic()
+            if self._stopping:
+                remaining = 0
+            try:
+                job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                return jobs, False
+            if job is None:
+                return jobs, True
+            jobs.append(job)
+
+    def _flush(self, jobs):
+        """Write the jobs, coalesced per kind. Returns the jobs whose write raised."""
+        import pandas as pd
+        started = time.perf_counter()
+        rounds = [df for kind, df in jobs if kind == 'rounds']
+        questionnaires = [df for kind, df in jobs if kind == 'questionnaire']
+        seeds = [df for kind, df in jobs if kind == 'seeds']
+        rows = 0
+        failed = []
+        for kind, frames, write in (('questionnaire', questionnaires, write_questionnaire_dataframe),
+                                    ('rounds', rounds, write_round_dataframe),
+                                    ('seeds', seeds, write_seeds_dataframe)):
+            if not frames:
+                continue
+            df = pd.concat(frames, ignore_index=True)
+            try:
+                write(df)
+                rows += len(df)
+            except Exception as e:
+                print(f"Write-behind flush failed, keeping {len(df)} {kind} rows for a retry: {e}")
+                metrics.inc('experiment_write_errors_total')
+                failed.extend((kind, frame) for frame in frames)
+                with self._lock:
+                    self.errors += 1
+        # Held batches are part of this flush, so no failure means everything before is written
+        for kind, session_id in jobs:
+            if kind != 'complete':
+                continue
+            if failed or not session_store().complete(session_id):
+                failed.append((kind, session_id))
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.batches_flushed += 1
+            self.rows_flushed += rows
+            self.last_flush_seconds = elapsed
+            self.total_flush_seconds += elapsed
+        return failed
+
+    def _run(self):
+        while True:
+            jobs, stop = self._collect()
+            jobs = self._failed + jobs
+            if jobs:
+                failed = self._flush(jobs)
+                with self._lock:
+                    self._failed = failed
+                    self._retries = self._retries + 1 if failed else 0
+            if stop:
+                break
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_writer():
+    """Return the process-wide write-behind queue, starting it on first use."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = WriteBehindQueue()
+            atexit.register(_writer.drain)
+        return _writer